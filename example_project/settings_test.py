@@ -1,5 +1,8 @@
 from settings import *
 
+# Permissions cache (and others) kept in process memory
+CACHE_BACKEND = 'locmem://'
+
 # Make celery fire up tasks synchronously
 CELERY_ALWAYS_EAGER = True
 
@@ -6,6 +6,7 @@ from django.utils.translation import ugettext as _
 from guardian.admin import GuardedModelAdmin
 
 from projector.models import Component
+from projector.models import DigestSubscription
 from projector.models import Membership
 from projector.models import Milestone
 from projector.models import Priority
@@ -171,6 +172,7 @@ admin.site.register(Project, ProjectAdmin)
 admin.site.register(ProjectCategory)
 admin.site.register(Membership)
 admin.site.register(Team)
+admin.site.register(DigestSubscription)
 #admin.site.register(Component)
 #admin.site.register(Milestone) # Should be maintain with project itself
 
@@ -0,0 +1,132 @@
+"""
+Clone pack cache for git repositories.
+
+Fresh clones (no objects at client's side) of the same repository state
+always receive the same objects, yet each of them requires walking whole
+object graph. :class:`ClonePackCache` keeps a pack with all objects
+reachable from repository's refs, built after each push, which is sent to
+such clients as is - only incremental fetches need graph walking.
+"""
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.utils import simplejson
+
+from dulwich.pack import write_pack_data
+
+PACK_FILENAME_PREFIX = 'projector-clone-'
+PACK_FILENAME_SUFFIX = '.pack'
+INFO_FILENAME = 'projector-clone.json'
+
+
+class ClonePackCache(object):
+    """
+    Clone pack of the given dulwich ``repo``. Packs are stored at
+    repository's control directory, named after the refs they were built
+    for, along with the information about the current one.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.info_path = os.path.join(repo.controldir(), INFO_FILENAME)
+
+    def get_tips(self):
+        """
+        Returns sorted list of shas pointed by repository's refs.
+        """
+        return sorted(set(self.repo.get_refs().values()))
+
+    def get_pack_path(self, tips):
+        """
+        Returns path of the pack built for given ``tips``.
+        """
+        name = hashlib.sha1(' '.join(tips)).hexdigest()
+        return os.path.join(self.repo.controldir(),
+            PACK_FILENAME_PREFIX + name + PACK_FILENAME_SUFFIX)
+
+    def build(self):
+        """
+        Writes pack with all objects reachable from current refs and points
+        the information file to it, then removes packs built before. As
+        packs are named after their refs, the information file never points
+        to a pack built for other refs than it lists, even if many builds
+        run at once. Files are replaced atomically, so clients being served
+        at the moment are not affected.
+
+        :returns: number of objects within the pack
+        """
+        tips = self.get_tips()
+        object_store = self.repo.object_store
+        objects = object_store.iter_shas(
+            object_store.find_missing_objects([], tips, lambda msg: None))
+        count = len(objects)
+        pack_path = self.get_pack_path(tips)
+        self._write(pack_path, lambda f: write_pack_data(f, objects, count))
+        info = simplejson.dumps({
+            'tips': tips,
+            'count': count,
+            'pack': os.path.basename(pack_path),
+        })
+        self._write(self.info_path, lambda f: f.write(info))
+        self._remove_packs(exclude=pack_path)
+        return count
+
+    def get(self, wants):
+        """
+        Returns tuple of opened pack file and number of objects within it if
+        the pack is up to date and contains all objects client ``wants``
+        (assuming client has no objects yet). Otherwise ``None`` is
+        returned. Caller is responsible for closing the file.
+        """
+        try:
+            info = simplejson.load(open(self.info_path))
+        except (IOError, ValueError):
+            return None
+        tips = self.get_tips()
+        if info['tips'] != tips or not set(wants).issubset(tips):
+            return None
+        if 'pack' not in info:
+            return None
+        # Pack is opened at once, as following build may remove it
+        try:
+            pack = open(os.path.join(self.repo.controldir(), info['pack']),
+                'rb')
+        except IOError:
+            return None
+        return pack, info['count']
+
+    def clear(self):
+        """
+        Removes the pack.
+        """
+        if os.path.exists(self.info_path):
+            os.remove(self.info_path)
+        self._remove_packs()
+
+    def _remove_packs(self, exclude=None):
+        pattern = os.path.join(self.repo.controldir(),
+            PACK_FILENAME_PREFIX + '*' + PACK_FILENAME_SUFFIX)
+        for path in glob.glob(pattern):
+            if path == exclude:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by concurrent build
+                pass
+
+    def _write(self, path, writer):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+            prefix='.tmp-')
+        f = os.fdopen(fd, 'wb')
+        try:
+            try:
+                writer(f)
+            finally:
+                f.close()
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
@@ -12,7 +12,12 @@ from dulwich.server import ProtocolGraphWalker
 from dulwich.web import HTTPGitApplication
 from dulwich.web import HTTPGitRequest
 
+from projector.contrib.git.clonecache import ClonePackCache
 from projector.contrib.git.utils import get_wsgi_response
+from projector.settings import get_config_value
+
+# Size of chunks cached clone pack is sent in
+CLONE_PACK_CHUNK_SIZE = 64 * 1024
 
 
 class GitWebServer(object):
@@ -22,16 +27,23 @@ class GitWebServer(object):
         WRITE = 'write'
         UNSPECIFIED = 'unspecified'
 
-    def __init__(self, repository):
+    def __init__(self, repository, repository_size=None):
         self.repository = repository
+        self.repository_size = repository_size
         self.response = HttpResponse()
 
-    def get_response(self, request):
-        backend = ProjectorGitBackend(self.repository)
+    def get_response(self, request, stream=False, on_finish=None):
+        """
+        Returns response of git's smart HTTP protocol for the ``request``.
+        See :func:`projector.contrib.git.utils.get_wsgi_response` for
+        ``stream`` and ``on_finish`` parameters.
+        """
+        backend = ProjectorGitBackend(self.repository, self.repository_size)
         app = GitApplication(backend, handlers={
             'git-upload-pack': ProjectorUploadPackHandler,
         })
-        return get_wsgi_response(app, request)
+        return get_wsgi_response(app, request, stream=stream,
+            on_finish=on_finish)
 
 
 class ProjectorHTTPGitRequest(HTTPGitRequest):
@@ -66,8 +78,9 @@ class GitApplication(HTTPGitApplication):
 
 class ProjectorGitBackend(Backend):
 
-    def __init__(self, repository):
+    def __init__(self, repository, repository_size=None):
         self.repository = repository
+        self.repository_size = repository_size
 
     def open_repository(self, path):
         """
@@ -78,7 +91,8 @@ class ProjectorGitBackend(Backend):
 
 class ProjectorUploadPackHandler(UploadPackHandler):
     """
-    handle method overridden in order to controll messages.
+    handle method overridden in order to controll messages and to serve
+    fresh clones from :class:`ClonePackCache`.
     """
 
     def handle(self):
@@ -86,23 +100,46 @@ class ProjectorUploadPackHandler(UploadPackHandler):
 
         graph_walker = ProtocolGraphWalker(self, self.repo.object_store,
             self.repo.get_peeled)
-        objects_iter = self.repo.fetch_objects(
-          graph_walker.determine_wants, graph_walker, self.progress,
-          get_tagged=self.get_tagged)
-
-        # Do they want any objects?
-        if len(objects_iter) == 0:
+        # Same steps as ``Repo.fetch_objects`` takes - wants and haves are
+        # needed in order to decide if cached pack may be used
+        object_store = self.repo.object_store
+        wants = graph_walker.determine_wants(self.repo.get_refs())
+        if not wants:
             return
-
-        #self.progress("dul-daemon says what\n")
-        self.progress("counting objects: %d, done.\n" % len(objects_iter))
-        write_pack_data(ProtocolFile(None, write), objects_iter,
-                        len(objects_iter))
+        haves = object_store.find_common_revisions(graph_walker)
+
+        cached = None
+        if not haves and get_config_value('GIT_CLONE_PACK_CACHE'):
+            cached = ClonePackCache(self.repo).get(wants)
+        if cached:
+            pack, count = cached
+            self.progress("counting objects: %d, done.\n" % count)
+            try:
+                for chunk in iter(lambda: pack.read(CLONE_PACK_CHUNK_SIZE),
+                        ''):
+                    write(chunk)
+            finally:
+                pack.close()
+        else:
+            objects_iter = object_store.iter_shas(
+                object_store.find_missing_objects(haves, wants, self.progress,
+                    get_tagged=self.get_tagged))
+
+            # Do they want any objects?
+            if len(objects_iter) == 0:
+                return
+
+            #self.progress("dul-daemon says what\n")
+            self.progress("counting objects: %d, done.\n" % len(objects_iter))
+            write_pack_data(ProtocolFile(None, write), objects_iter,
+                            len(objects_iter))
         #self.progress("how was that, then?\n")
-        size = self.backend.repository.info.size
-        msg = _('Repository size: %s\n' % filesizeformat(size))
-        logging.info(msg)
-        self.progress(msg)
+        # Stored size is used as walking the repository is expensive
+        size = self.backend.repository_size
+        if size is not None:
+            msg = _('Repository size: %s\n' % filesizeformat(size))
+            logging.info(msg)
+            self.progress(msg)
         # we are done
         self.proto.write("0000")
 
@@ -1,7 +1,12 @@
 import copy
+import sys
+import threading
+import Queue
 
 from django.http import HttpResponse
 
+from projector.settings import get_config_value
+
 def is_git_request(request):
     """
     Returns True if request was made by git user agent, False otherwise.
@@ -23,17 +28,212 @@ class GitResponse(HttpResponse):
             super(GitResponse, self).write(content)
 
 
-def get_wsgi_response(app, request):
+class ChunkedInput(object):
+    """
+    File-like object decoding request body sent with chunked transfer
+    encoding from the given ``stream``, as the data is read (nothing is
+    buffered besides the data requested by the caller).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        # Number of bytes left at the current chunk
+        self.remaining = 0
+        self.finished = False
+
+    def read(self, size=-1):
+        """
+        Reads at most ``size`` bytes (all remaining data if ``size`` is
+        negative). Empty string is returned at the end of the body.
+        """
+        chunks = []
+        while not self.finished and size != 0:
+            if not self.remaining:
+                self._read_chunk_header()
+                continue
+            if size < 0:
+                to_read = self.remaining
+            else:
+                to_read = min(size, self.remaining)
+            data = self.stream.read(to_read)
+            if not data:
+                raise IOError("Unexpected end of chunked request body")
+            chunks.append(data)
+            self.remaining -= len(data)
+            if size > 0:
+                size -= len(data)
+            if not self.remaining:
+                # Skip CRLF following chunk's data
+                self.stream.readline()
+        return ''.join(chunks)
+
+    def _read_chunk_header(self):
+        line = self.stream.readline()
+        try:
+            # Chunk size may be followed by extensions
+            self.remaining = int(line.split(';', 1)[0].strip(), 16)
+        except ValueError:
+            raise IOError("Invalid chunk header: %r" % line)
+        if not self.remaining:
+            # Last chunk - skip trailers up to the empty line
+            while self.stream.readline().strip():
+                pass
+            self.finished = True
+
+
+def get_wsgi_environ(request):
+    """
+    Returns copy of WSGI environment of the ``request``. Request body is not
+    read - if it was sent with chunked transfer encoding, server passes it
+    undecoded (see :setting:`PROJECTOR_GIT_DECODE_CHUNKED_INPUT`) and
+    didn't announce decoding it with ``wsgi.input_terminated``,
+    ``wsgi.input`` is wrapped with :class:`ChunkedInput`, so it can be
+    consumed incrementally until the end of the body.
+    """
+    env = copy.copy(request.META)
+    encoding = env.get('HTTP_TRANSFER_ENCODING', '').lower()
+    if encoding == 'chunked':
+        # Content length of chunked request is unknown
+        env.pop('CONTENT_LENGTH', None)
+        if get_config_value('GIT_DECODE_CHUNKED_INPUT') and \
+                not env.get('wsgi.input_terminated'):
+            env['wsgi.input'] = ChunkedInput(env['wsgi.input'])
+    return env
+
+
+class WSGIStream(object):
+    """
+    Runs WSGI application at separate thread and exposes data it writes (by
+    ``write`` callable returned from ``start_response`` or as returned
+    iterable) as an iterator. At most ``max_chunks`` chunks are buffered -
+    application is blocked until they are consumed, so memory needed to
+    pass the response doesn't depend on its size.
+
+    ``on_finish`` callable (if given) is called after all the data has been
+    consumed.
+
+    Streaming works only if nothing reads whole ``content`` of the response
+    before it is returned by the server - middleware accessing
+    ``response.content`` (i.e. ``CommonMiddleware`` computing ETags if
+    ``USE_ETAGS`` is ``True``, or ``GZipMiddleware``) buffers whole pack in
+    memory again.
+    """
+    # Marks the end of the stream at the queue
+    DONE = object()
+    # Seconds after which blocked application checks if stream is closed
+    POLL_TIMEOUT = 1
+
+    def __init__(self, app, environ, max_chunks=16, on_finish=None):
+        self.app = app
+        self.environ = environ
+        self.on_finish = on_finish
+        self.status = None
+        self.headers = []
+        self.closed = False
+        self._error = None
+        self._queue = Queue.Queue(max_chunks)
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+
+    def start(self):
+        """
+        Starts the application and waits until it starts the response.
+        Exceptions raised by the application before are re-raised here.
+        """
+        self._thread.start()
+        self._started.wait()
+        self._raise_error()
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = status
+        self.headers = headers
+        self._started.set()
+        return self.write
+
+    def write(self, data):
+        if data and not self._put(data):
+            raise IOError("Stream has been closed by the client")
+
+    def close(self):
+        """
+        Stops the application if the response has not been consumed and
+        waits until it returns, so objects it uses (i.e. pooled repository)
+        are not used by other threads after the response is closed.
+        """
+        self.closed = True
+        if self._thread.isAlive():
+            self._thread.join()
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is self.DONE:
+                break
+            yield chunk
+        self._raise_error()
+        if self.on_finish is not None:
+            self.on_finish()
+
+    def _run(self):
+        try:
+            result = self.app(self.environ, self.start_response)
+            try:
+                for chunk in result:
+                    self.write(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except Exception:
+            self._error = sys.exc_info()
+        # Application could fail before starting the response
+        self._started.set()
+        self._put(self.DONE)
+
+    def _put(self, item):
+        """
+        Puts ``item`` into the queue, waiting until there is a free slot.
+        Returns ``False`` if the stream has been closed meanwhile.
+        """
+        while not self.closed:
+            try:
+                self._queue.put(item, timeout=self.POLL_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error[0], error[1], error[2]
+
+
+def get_wsgi_response(app, request, stream=False, on_finish=None):
     """
     Returns ``django.http.HttpResponse`` object from WSGI applcation.
+
+    If ``stream`` is ``True``, response's content is an iterator passing the
+    data as application generates it (see :class:`WSGIStream`) instead of
+    being buffered - ``on_finish`` would be called after it is consumed.
     """
+    env = get_wsgi_environ(request)
+    if stream:
+        wsgi_stream = WSGIStream(app, env, on_finish=on_finish)
+        wsgi_stream.start()
+        response = HttpResponse(wsgi_stream)
+        response.status_code = int(wsgi_stream.status[:3])
+        for key, val in wsgi_stream.headers:
+            response[key] = val
+        return response
+
     response = GitResponse()
     def start_response(status, headers):
         response.status_code = int(status[:3])
         for key, val in headers:
             response[key] = val
         return response.write
-    env = copy.copy(request.META)
     response.write(app(env, start_response))
+    if on_finish is not None:
+        on_finish()
     return response
-
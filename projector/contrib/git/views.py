@@ -6,6 +6,8 @@ from django.core.exceptions import PermissionDenied
 
 from projector.contrib.git.utils import is_git_request
 from projector.contrib.git.githttp import GitWebServer
+from projector.core.permissions import get_permission_resolver
+from projector.core.repositories import get_pooled_repository
 from projector.views.project import ProjectView
 
 from vcs.web.simplevcs.utils import log_error, ask_basic_auth, basic_auth
@@ -66,10 +68,13 @@ class ProjectGitHandler(ProjectGitBaseView):
             if auth_response:
                 return auth_response
 
-            git_server = GitWebServer(self.project.repository)
-            response = git_server.get_response(request)
-
-            self.send_post_signals()
+            git_server = GitWebServer(
+                get_pooled_repository(self.project.repository),
+                self.project.repository_size)
+            # Packs sent to the client are streamed as they are generated -
+            # post signals are sent after whole response is consumed
+            response = git_server.get_response(request,
+                stream=self.is_read(), on_finish=self.send_post_signals)
         except Exception, err:
             log_error(err)
             raise err
@@ -127,15 +132,16 @@ class ProjectGitHandler(ProjectGitBaseView):
             return ask_basic_auth(self.request,
                 realm=self.project.config.basic_realm)
 
+        resolver = get_permission_resolver(self.request.user)
         if self.project.is_public() and self.is_write() and not\
-            self.request.user.has_perm('can_write_to_repository', self.project):
+            resolver.has_perm('can_write_to_repository', self.project):
             raise PermissionDenied
 
         if self.project.is_private() and not\
-            self.request.user.has_perm('can_read_repository', self.project):
+            resolver.has_perm('can_read_repository', self.project):
             raise PermissionDenied
         if self.project.is_private() and self.is_write() and not\
-            self.request.user.has_perm('can_write_to_repository', self.project):
+            resolver.has_perm('can_write_to_repository', self.project):
             raise PermissionDenied
         return
 
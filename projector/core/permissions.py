@@ -0,0 +1,182 @@
+"""
+Object permissions resolution for :model:`Project` instances.
+
+Checking permissions with ``user.has_perm(perm, project)`` costs a database
+query for each check. :class:`PermissionResolver` loads all permissions of
+the user for the project (granted directly and through user's groups, i.e.
+teams) with one query and memoizes them. Resolver is attached to the user
+object, which lives as long as the request, so views, template tags and
+forms processing the same request share it (see
+:func:`get_permission_resolver`).
+
+If :setting:`PROJECTOR_SHARED_CACHE` is ``True``, permission sets are also
+stored at Django's cache backend for
+:setting:`PROJECTOR_PERMISSIONS_CACHE_TIMEOUT` seconds. Cache keys contain
+versions of the project's and user's permissions - whenever object
+permissions, teams or group memberships change, signal listeners bump
+proper version (see :func:`bump_project_perms_version` and
+:func:`bump_user_perms_version`) and stale entries are never read again.
+Versions are bumped at the cache of the process which made the change only,
+so the cache is not used if it is not shared by all processes - otherwise
+revoked permissions would still be granted by other processes.
+"""
+import uuid
+
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Q
+
+from projector.settings import get_config_value
+
+from guardian.shortcuts import get_perms
+
+# Versions should outlive cached entries - 30 days is the longest timeout
+# accepted by memcached
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _get_version_key(kind, pk):
+    return 'projector:perms:version:%s:%s' % (kind, pk)
+
+def _get_versions(keys):
+    """
+    Returns list of versions stored at given keys. Missing versions (never
+    set or evicted) are created - new version is random, so entries cached
+    with evicted version would not become valid again.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex[:12], VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def bump_project_perms_version(project_pk):
+    """
+    Invalidates cached permissions of all users and groups for the project.
+    """
+    cache.set(_get_version_key('project', project_pk), uuid.uuid4().hex[:12],
+        VERSION_TIMEOUT)
+
+def bump_user_perms_version(user_pk):
+    """
+    Invalidates cached permissions of the user for all projects.
+    """
+    cache.set(_get_version_key('user', user_pk), uuid.uuid4().hex[:12],
+        VERSION_TIMEOUT)
+
+def get_cached(name, project, loader, user=None):
+    """
+    Returns value computed by ``loader`` (called without arguments) for the
+    ``project`` (and ``user``, if given) using cache. ``name`` should
+    identify computed value among others related with the project.
+
+    Cache is not used unless :setting:`PROJECTOR_SHARED_CACHE` is ``True``.
+    """
+    timeout = get_config_value('PERMISSIONS_CACHE_TIMEOUT')
+    if not timeout or not get_config_value('SHARED_CACHE'):
+        return loader()
+    version_keys = [_get_version_key('project', project.pk)]
+    if user is not None:
+        version_keys.append(_get_version_key('user', user.pk))
+    key = 'projector:perms:%s:%s:%s' % (name, project.pk,
+        ':'.join(_get_versions(version_keys)))
+    value = cache.get(key)
+    if value is None:
+        value = loader()
+        cache.set(key, value, timeout)
+    return value
+
+def get_cached_perms(user_or_group, project):
+    """
+    Returns list of permission codenames granted for the ``project`` to the
+    given user or group, as ``guardian.shortcuts.get_perms`` does, using
+    cache.
+    """
+    loader = lambda: list(get_perms(user_or_group, project))
+    if isinstance(user_or_group, Group):
+        return get_cached('group:%s' % user_or_group.pk, project, loader)
+    return get_cached('user:%s' % user_or_group.pk, project, loader,
+        user=user_or_group)
+
+
+def get_project_perms(user, project):
+    """
+    Returns queryset of ``Permission`` objects granted to the ``user`` for the
+    ``project``, either directly or through any of user's groups.
+    """
+    ctype = ContentType.objects.get_for_model(project)
+    return Permission.objects\
+        .filter(content_type=ctype)\
+        .filter(
+            Q(userobjectpermission__user=user,
+              userobjectpermission__content_type=ctype,
+              userobjectpermission__object_pk=project.pk) |
+            Q(groupobjectpermission__group__user=user,
+              groupobjectpermission__content_type=ctype,
+              groupobjectpermission__object_pk=project.pk))\
+        .distinct()
+
+
+class PermissionResolver(object):
+    """
+    Resolves permissions of the ``user`` for projects. Permissions are
+    fetched once per project and memoized - use ``clear`` after they are
+    changed.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._perms = {}
+
+    def get_perms(self, project):
+        """
+        Returns list of ``Permission`` objects granted to the user for the
+        given ``project``. Inactive and anonymous users have no permissions.
+        """
+        if not self.user.is_active or self.user.is_anonymous():
+            return []
+        if project.pk not in self._perms:
+            loader = lambda: list(get_project_perms(self.user, project))
+            self._perms[project.pk] = get_cached('resolver:%s' % self.user.pk,
+                project, loader, user=self.user)
+        return self._perms[project.pk]
+
+    def get_codenames(self, project):
+        """
+        Returns set of codenames of permissions granted to the user for the
+        given ``project``.
+        """
+        return set(perm.codename for perm in self.get_perms(project))
+
+    def has_perm(self, perm, project):
+        """
+        Returns ``True`` if user has ``perm`` (codename) for the ``project``.
+        Active superusers have all permissions.
+        """
+        if self.user.is_active and self.user.is_superuser:
+            return True
+        return perm in self.get_codenames(project)
+
+    def clear(self, project=None):
+        """
+        Forgets memoized permissions for the ``project`` (or all of them).
+        """
+        if project is None:
+            self._perms.clear()
+        else:
+            self._perms.pop(project.pk, None)
+
+
+def get_permission_resolver(user):
+    """
+    Returns :class:`PermissionResolver` for the given user, creating it at
+    the first call.
+    """
+    resolver = getattr(user, '_permission_resolver', None)
+    if resolver is None:
+        resolver = PermissionResolver(user)
+        user._permission_resolver = resolver
+    return resolver
+
@@ -0,0 +1,160 @@
+"""
+Pool of opened vcs repositories.
+
+Opening repository (reading refs, indexes, packs) is repeated for every
+request as each of them fetches new :model:`Project` (and related
+``Repository``) instance. :class:`RepositoryPool` keeps at most
+:setting:`PROJECTOR_REPOSITORY_POOL_SIZE` recently used repositories opened
+by each thread. Repository objects are not safe to be used by many threads
+at once, so they are never shared between threads.
+
+Repositories are changed by pushes handled by any of the processes, so each
+pooled repository is stored along with its version and reopened if the
+version changes. Version consists of modification times and sizes of
+repository's refs, packs and changelog (see :func:`get_repository_version`),
+which change with each push, whichever process handled it. If
+:setting:`PROJECTOR_SHARED_CACHE` is ``True``, version also contains
+identifier kept at Django's cache backend, set anew by
+:func:`invalidate_repository` (called after push).
+"""
+import os
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.utils.datastructures import SortedDict
+
+from projector.core.permissions import VERSION_TIMEOUT
+from projector.settings import get_config_value
+
+# Paths (relative to repository's root) changed whenever repository is
+# changed, for both bare and non bare git repositories and mercurial ones
+VERSION_PATHS = (
+    'packed-refs',
+    'objects/pack',
+    '.git/packed-refs',
+    '.git/objects/pack',
+    '.hg/store/00changelog.i',
+    '.hg/bookmarks',
+)
+# Directories of git refs - each of their subdirectories is checked too
+VERSION_REFS_DIRS = ('refs', '.git/refs')
+
+
+def _get_version_key(path):
+    return 'projector:repository:version:%s' % path
+
+def _get_stamp(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime, info.st_size
+
+def get_repository_version(path):
+    """
+    Returns version of the repository at given ``path`` - it changes
+    whenever repository is changed.
+    """
+    version = [_get_stamp(os.path.join(path, name)) for name in VERSION_PATHS]
+    for name in VERSION_REFS_DIRS:
+        refs_dir = os.path.join(path, name)
+        if not os.path.isdir(refs_dir):
+            continue
+        for root, dirs, files in os.walk(refs_dir):
+            dirs.sort()
+            version.append((root, _get_stamp(root)))
+    if get_config_value('SHARED_CACHE'):
+        key = _get_version_key(path)
+        cache_version = cache.get(key)
+        if cache_version is None:
+            cache.add(key, uuid.uuid4().hex[:12], VERSION_TIMEOUT)
+            cache_version = cache.get(key)
+        version.append(cache_version)
+    return version
+
+
+class RepositoryPool(object):
+    """
+    LRU of opened repositories keyed by path. Each thread has its own
+    repositories.
+    """
+
+    def __init__(self, size=None):
+        self._size = size
+        self._local = threading.local()
+
+    @property
+    def size(self):
+        if self._size is None:
+            return get_config_value('REPOSITORY_POOL_SIZE')
+        return self._size
+
+    @property
+    def _repos(self):
+        repos = getattr(self._local, 'repos', None)
+        if repos is None:
+            repos = self._local.repos = SortedDict()
+        return repos
+
+    def get(self, path, opener):
+        """
+        Returns repository at given ``path`` from the pool. If it is not
+        pooled (or has been changed since it was opened), ``opener`` is
+        called (without arguments) and returned repository is pooled.
+        """
+        version = get_repository_version(path)
+        repos = self._repos
+        entry = repos.pop(path, None)
+        if entry is not None and entry[0] == version:
+            # Move to the end as the most recently used
+            repos[path] = entry
+            return entry[1]
+
+        repo = opener()
+        repos[path] = (version, repo)
+        while len(repos) > self.size:
+            del repos[repos.keyOrder[0]]
+        return repo
+
+    def forget(self, path):
+        """
+        Removes repository at given ``path`` from this pool only.
+        """
+        self._repos.pop(path, None)
+
+    def clear(self):
+        self._repos.clear()
+
+    def __contains__(self, path):
+        return path in self._repos
+
+    def __len__(self):
+        return len(self._repos)
+
+
+pool = RepositoryPool()
+
+def get_pooled_repository(repository):
+    """
+    Makes given ``vcs.web.simplevcs.models.Repository`` instance use vcs
+    repository from the pool (its lazily opened ``_repo`` attribute is set)
+    and returns it. Returned instance should not be passed to other threads,
+    unless the current one waits until they finish.
+    """
+    if pool.size > 0:
+        repository.__dict__['_repo'] = pool.get(repository.path,
+            lambda: repository._repo)
+    return repository
+
+def invalidate_repository(path):
+    """
+    Marks repository at given ``path`` as changed - it would be reopened by
+    the current thread and, if :setting:`PROJECTOR_SHARED_CACHE` is
+    ``True``, by all other threads and processes (otherwise they notice the
+    change by repository's files only).
+    """
+    pool.forget(path)
+    if get_config_value('SHARED_CACHE'):
+        cache.set(_get_version_key(path), uuid.uuid4().hex[:12],
+            VERSION_TIMEOUT)
@@ -14,6 +14,7 @@ from guardian.shortcuts import assign, remove_perm, get_perms,\
     get_perms_for_model
 
 from projector.core.exceptions import ProjectorError
+from projector.core.permissions import get_permission_resolver
 from projector.forks.base import BaseExternalForkForm
 from projector.models import Membership
 from projector.models import Team
@@ -304,6 +305,8 @@ class ProjectMembershipPermissionsForm(forms.Form):
                             )
                         }))
                 self._message('warning', _("Permission removed: %s" % perm))
+        if self.request:
+            get_permission_resolver(self.request.user).clear(project)
 
 
 class ProjectTeamPermissionsForm(forms.Form):
@@ -344,6 +347,8 @@ class ProjectTeamPermissionsForm(forms.Form):
             if perm not in granted_perms:
                 remove_perm(perm, group, project)
                 self._message('warning', _("Permission removed: %s" % perm))
+        if self.request:
+            get_permission_resolver(self.request.user).clear(project)
 
 
 class TeamForm(LimitingModelForm):
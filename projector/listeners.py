@@ -1,19 +1,30 @@
 import logging
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db.models.signals import m2m_changed
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.tokens import default_token_generator
 from django.template.defaultfilters import filesizeformat
 from django.utils.translation import ugettext_lazy as _
 
 from projector.settings import get_config_value
-from projector.models import Project, Task, WatchedItem
+from projector.core.permissions import bump_project_perms_version
+from projector.core.permissions import bump_user_perms_version
+from projector.core.repositories import invalidate_repository
+from projector.models import Project, Task, TaskRevision, TaskSearchTerm
+from projector.models import Config, Membership, ProjectVisibility, Team
+from projector.models import WatchedItem
 from projector.signals import post_fork
 from projector.signals import setup_project
 from projector.tasks import setup_project as setup_project_task
+from projector.tasks import build_clone_pack, update_repository_size
+
+from guardian.models import GroupObjectPermission, UserObjectPermission
 
 from richtemplates.utils import get_user_profile_model
 
+from vcs.web.simplevcs.signals import post_push
 from vcs.web.simplevcs.signals import retrieve_hg_post_push_messages
 
 def request_new_profile(sender, instance, **kwargs):
@@ -61,6 +72,94 @@ def task_save_listener(sender, instance, **kwargs):
         # Task was updated
         pass
 
+def task_init_listener(sender, instance, **kwargs):
+    """
+    Remembers state of fetched task used to maintain task counters and
+    search index.
+    """
+    if instance.pk:
+        instance._counted_state = (instance.status_id, instance.milestone_id)
+        instance._indexed_text = (instance.summary, instance.description)
+
+def task_index_listener(sender, instance, **kwargs):
+    """
+    Updates search index if task's summary or description has changed.
+    """
+    text = (instance.summary, instance.description)
+    if kwargs['created'] is True:
+        TaskSearchTerm.objects.index_tasks([instance])
+    elif getattr(instance, '_indexed_text', None) != text:
+        TaskSearchTerm.objects.index_task(instance)
+    instance._indexed_text = text
+
+def taskrevision_index_listener(sender, instance, **kwargs):
+    """
+    Adds comment of the new task revision to the search index.
+    """
+    if kwargs['created'] is True and instance.comment:
+        TaskSearchTerm.objects.index_comment(instance)
+
+def task_delete_listener(sender, instance, **kwargs):
+    """
+    Updates task counters after task is deleted.
+    """
+    state = (instance.status_id, instance.milestone_id)
+    Task.update_counters(instance.project_id, [(state, None)])
+
+def object_permission_listener(sender, instance, **kwargs):
+    """
+    Invalidates cached permissions for project after any user's or group's
+    permission for it is granted or removed.
+    """
+    if instance.content_type_id == \
+            ContentType.objects.get_for_model(Project).id:
+        bump_project_perms_version(instance.object_pk)
+
+def team_listener(sender, instance, **kwargs):
+    """
+    Invalidates cached permissions and refreshes visibility for project
+    after team is added or removed.
+    """
+    bump_project_perms_version(instance.project_id)
+    ProjectVisibility.objects.refresh(projects=[instance.project_id])
+
+def membership_listener(sender, instance, **kwargs):
+    """
+    Refreshes project visibility after membership is added or removed.
+    """
+    ProjectVisibility.objects.refresh(users=[instance.member_id],
+        projects=[instance.project_id])
+
+def user_groups_listener(sender, instance, action, reverse, pk_set,
+        **kwargs):
+    """
+    Invalidates cached permissions and refreshes project visibility of users
+    whose groups have changed.
+    """
+    if reverse and action == 'pre_clear':
+        # Group's users are needed after they are removed
+        instance._cleared_user_pks = list(instance.user_set\
+            .values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_pks = [instance.pk]
+    elif action == 'post_clear':
+        user_pks = getattr(instance, '_cleared_user_pks', [])
+    else:
+        user_pks = list(pk_set)
+    for pk in user_pks:
+        bump_user_perms_version(pk)
+    if user_pks:
+        ProjectVisibility.objects.refresh(users=user_pks)
+
+def config_listener(sender, instance, **kwargs):
+    """
+    Removes changed (or deleted) :model:`Config` from the cache.
+    """
+    instance.clear_cache()
+
 def watcheditem_save_listener(sender, instance, **kwargs):
     if kwargs['created'] is True:
         logging.info("%s started watching %s" % (instance.user,
@@ -74,14 +173,32 @@ def watcheditem_delete_listener(sender, instance, **kwargs):
         instance.content_object))
 
 
+def repository_push_listener(sender, repo_path, **kwargs):
+    """
+    Reopens pushed repository at all processes and schedules update of its
+    stored size and clone pack.
+    """
+    invalidate_repository(repo_path)
+    project_pks = Project.objects\
+        .filter(repository__path=repo_path)\
+        .values_list('pk', flat=True)
+    for project_pk in project_pks:
+        update_repository_size.delay(project_pk)
+        build_clone_pack.delay(project_pk)
+
 def hg_extra_messages(sender, repository, **kwargs):
     """
     Adds extra messages appended to request after successful push
-    to mercurial repository.
+    to mercurial repository. Size stored at the project is used, so the
+    repository is not walked.
     """
-    size = repository.info.size
-    msg = _('Repository size: %s' % filesizeformat(size))
-    sender.messages.append(msg)
+    sizes = Project.objects\
+        .filter(repository__path=repository.path)\
+        .exclude(repository_size=None)\
+        .values_list('repository_size', flat=True)
+    if sizes:
+        msg = _('Repository size: %s' % filesizeformat(sizes[0]))
+        sender.messages.append(msg)
 
 
 def start_listening():
@@ -91,8 +208,22 @@ def start_listening():
     module.
     """
     post_save.connect(request_new_profile, sender=User)
+    post_init.connect(task_init_listener, sender=Task)
     post_save.connect(task_save_listener, sender=Task)
+    post_save.connect(task_index_listener, sender=Task)
+    post_save.connect(taskrevision_index_listener, sender=TaskRevision)
+    post_delete.connect(task_delete_listener, sender=Task)
     post_save.connect(watcheditem_save_listener, sender=WatchedItem)
+    for model in (UserObjectPermission, GroupObjectPermission):
+        post_save.connect(object_permission_listener, sender=model)
+        post_delete.connect(object_permission_listener, sender=model)
+    post_save.connect(team_listener, sender=Team)
+    post_delete.connect(team_listener, sender=Team)
+    post_save.connect(membership_listener, sender=Membership)
+    post_delete.connect(membership_listener, sender=Membership)
+    post_save.connect(config_listener, sender=Config)
+    post_delete.connect(config_listener, sender=Config)
+    m2m_changed.connect(user_groups_listener, sender=User.groups.through)
     post_delete.connect(watcheditem_delete_listener, sender=WatchedItem)
 
     # Projector signals connection
@@ -100,4 +231,5 @@ def start_listening():
     setup_project.connect(setup_project_listener, sender=Project)
     #retrieve_hg_post_push_messages.connect(hg_extra_messages,
         #sender=None)
+    post_push.connect(repository_push_listener, sender=None)
 
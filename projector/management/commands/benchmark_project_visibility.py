@@ -0,0 +1,85 @@
+import random
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from django.db.models import Q
+
+from projector.models import Membership, Project, ProjectVisibility
+from projector.utils.database import bulk_insert
+
+
+def for_user_with_joins(user):
+    """
+    Previous implementation of ``ProjectManager.for_user`` kept for
+    comparison.
+    """
+    return Project.objects.filter(
+            Q(public=True) |
+            Q(public=False, membership__member=user) |
+            Q(public=False, team__group__user=user))\
+        .select_related('membership__member')\
+        .order_by('name')\
+        .distinct()
+
+
+class Command(NoArgsCommand):
+    help = ("Compares project visibility query with its previous, join based "
+            "implementation. Benchmark data is created inside transaction "
+            "which is rolled back at the end.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--projects', dest='projects', type='int', default=10000,
+            help="Number of projects to create"),
+        make_option('--memberships', dest='memberships', type='int',
+            default=50000, help="Number of memberships to create"),
+        make_option('--users', dest='users', type='int', default=1000,
+            help="Number of users to create"),
+        make_option('--repeat', dest='repeat', type='int', default=20,
+            help="Number of users for which queries are timed"),
+    )
+
+    def handle_noargs(self, **options):
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            users = self.populate(options['users'], options['projects'],
+                options['memberships'])
+            sample = random.sample(users, min(options['repeat'], len(users)))
+            for name, func in (
+                    ('joins + DISTINCT', for_user_with_joins),
+                    ('visibility table', Project.objects.for_user)):
+                start = time.time()
+                for user in sample:
+                    list(func(user).values_list('pk', flat=True))
+                elapsed = (time.time() - start) / len(sample)
+                print "[INFO] %-16s %8.2f ms per user" % (name, elapsed * 1000)
+        finally:
+            transaction.rollback()
+            transaction.leave_transaction_management()
+
+    def populate(self, user_count, project_count, membership_count):
+        prefix = 'benchmark-%d' % time.time()
+        bulk_insert(User, [User(username='%s-%d' % (prefix, i),
+            email='%s-%d@example.com' % (prefix, i), password='!')
+            for i in xrange(user_count)])
+        users = list(User.objects.filter(username__startswith=prefix))
+
+        bulk_insert(Project, [Project(name='%s-%d' % (prefix, i),
+            author=random.choice(users), public=bool(i % 3))
+            for i in xrange(project_count)])
+        project_pks = list(Project.objects\
+            .filter(name__startswith=prefix)\
+            .values_list('pk', flat=True))
+
+        pairs = set()
+        membership_count = min(membership_count, len(users) * len(project_pks))
+        while len(pairs) < membership_count:
+            pairs.add((random.choice(users).pk, random.choice(project_pks)))
+        bulk_insert(Membership, [Membership(member_id=user_pk,
+            project_id=project_pk) for user_pk, project_pk in pairs])
+        # Rows inserted above bypass signals
+        ProjectVisibility.objects.refresh(users=[user.pk for user in users])
+        return users
+
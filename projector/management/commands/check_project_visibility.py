@@ -0,0 +1,36 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from projector.models import ProjectVisibility, Visibility
+
+
+class Command(NoArgsCommand):
+    help = ("Checks if project visibility table is consistent with "
+            "memberships and teams")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--fix', action='store_true', dest='fix', default=False,
+            help="Fix found inconsistencies"),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        missing, stale = ProjectVisibility.objects.check()
+        if verbosity >= 2:
+            via = Visibility.as_dict()
+            for label, rows in (('Missing', missing), ('Stale', stale)):
+                for user_pk, project_pk, via_value in sorted(rows):
+                    print "[INFO] %s row: user=%s project=%s via=%s"\
+                        % (label, user_pk, project_pk, via[via_value])
+        if not missing and not stale:
+            if verbosity >= 1:
+                print "[INFO] Project visibility table is consistent"
+            return
+        if not options['fix']:
+            raise CommandError("Project visibility table is inconsistent: %d "
+                "row(s) missing, %d stale (use --fix to repair)"
+                % (len(missing), len(stale)))
+        added, removed = ProjectVisibility.objects.refresh()
+        if verbosity >= 1:
+            print "[INFO] Fixed: %d row(s) added, %d removed"\
+                % (added, removed)
@@ -0,0 +1,25 @@
+from django.core.management.base import NoArgsCommand, CommandError
+
+from projector.models import Task
+from projector.settings import get_config_value
+
+
+class Command(NoArgsCommand):
+    help = ("Stores descriptions of older task revisions as deltas (see "
+            "PROJECTOR_TASK_REVISION_SNAPSHOT_INTERVAL setting)")
+
+    def handle_noargs(self, **options):
+        if not get_config_value('TASK_REVISION_SNAPSHOT_INTERVAL'):
+            raise CommandError("PROJECTOR_TASK_REVISION_SNAPSHOT_INTERVAL is "
+                "set to 0 - delta storage is disabled")
+        verbosity = int(options.get('verbosity', 1))
+        compacted = 0
+        for task in Task.objects.only('pk').iterator():
+            count = task.compact_revisions()
+            if count and verbosity >= 2:
+                print "[INFO] Compacted %d revision(s) of task with pk %s"\
+                    % (count, task.pk)
+            compacted += count
+        if verbosity >= 1:
+            print "[INFO] Compacted %d revision(s)" % compacted
+
@@ -0,0 +1,99 @@
+import datetime
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+
+from projector.models import Project, Task
+
+
+class Command(BaseCommand):
+    args = '<username> <project_slug> <file>'
+    help = ("Imports tasks from JSON file into the project. File should "
+            "contain list of objects with 'summary' and 'description' keys. "
+            "Optional keys are: 'author', 'owner' (usernames), 'status', "
+            "'priority', 'type', 'component', 'milestone' (names), "
+            "'deadline' (YYYY-MM-DD) and 'created_at' (YYYY-MM-DD HH:MM:SS).")
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+            default=500, help="Number of tasks inserted at once"),
+        make_option('--no-notify', action='store_false', dest='notify',
+            default=True, help="Don't send summary message to watchers"),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 3:
+            raise CommandError("Usage: import_tasks %s" % self.args)
+        username, project_slug, path = args
+        try:
+            self.project = Project.objects.get(author__username=username,
+                slug=project_slug)
+        except Project.DoesNotExist:
+            raise CommandError("Project %s/%s does not exist"
+                % (username, project_slug))
+        try:
+            data = simplejson.load(open(path))
+        except (IOError, ValueError), err:
+            raise CommandError("Cannot read tasks from %s: %s" % (path, err))
+
+        self.defaults = Task.objects.get_for_project(self.project)
+        self.lookups = {
+            'status': self.project.status_set.all(),
+            'priority': self.project.priority_set.all(),
+            'type': self.project.tasktype_set.all(),
+            'component': self.project.component_set.all(),
+            'milestone': self.project.milestone_set.all(),
+        }
+        for field, queryset in self.lookups.items():
+            self.lookups[field] = dict((obj.name, obj) for obj in queryset)
+        self.users = {}
+
+        tasks = (self.build_task(info) for info in data)
+        imported = Task.objects.bulk_import(self.project, tasks,
+            batch_size=options['batch_size'], notify=options['notify'])
+        if int(options.get('verbosity', 1)) >= 1:
+            print "[INFO] Imported %d task(s) into %s" % (imported, self.project)
+
+    def get_user(self, username):
+        if username not in self.users:
+            try:
+                self.users[username] = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError("User %s does not exist" % username)
+        return self.users[username]
+
+    def get_related(self, field, info):
+        name = info.get(field)
+        if name is None:
+            return getattr(self.defaults, field)
+        try:
+            return self.lookups[field][name]
+        except KeyError:
+            raise CommandError("Project %s has no %s named %s"
+                % (self.project, field, name))
+
+    def build_task(self, info):
+        task = Task(
+            project = self.project,
+            summary = info['summary'],
+            description = info['description'],
+            author = self.get_user(info.get('author',
+                self.project.author.username)),
+            author_ip = '',
+            status = self.get_related('status', info),
+            priority = self.get_related('priority', info),
+            type = self.get_related('type', info),
+            component = self.get_related('component', info),
+            milestone = self.get_related('milestone', info),
+        )
+        if info.get('owner'):
+            task.owner = self.get_user(info['owner'])
+        if info.get('deadline'):
+            task.deadline = datetime.datetime.strptime(info['deadline'],
+                '%Y-%m-%d').date()
+        if info.get('created_at'):
+            task.created_at = datetime.datetime.strptime(info['created_at'],
+                '%Y-%m-%d %H:%M:%S')
+        return task
+
@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+
+from projector.models import ProjectVisibility
+
+
+class Command(NoArgsCommand):
+    help = ("Recreates project visibility table from memberships and teams")
+
+    def handle_noargs(self, **options):
+        added, removed = ProjectVisibility.objects.refresh()
+        if int(options.get('verbosity', 1)) >= 1:
+            print "[INFO] Project visibility rebuilt: %d row(s) added, "\
+                "%d removed" % (added, removed)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from projector.models import Project, TaskSearchTerm
+
+
+class Command(BaseCommand):
+    args = '[<username> <project_slug>]'
+    help = ("Recreates task search index of the given project or, if no "
+            "project is given, of all projects")
+
+    def handle(self, *args, **options):
+        if len(args) not in (0, 2):
+            raise CommandError("Usage: rebuild_task_index %s" % self.args)
+        project = None
+        if args:
+            username, project_slug = args
+            try:
+                project = Project.objects.get(author__username=username,
+                    slug=project_slug)
+            except Project.DoesNotExist:
+                raise CommandError("Project %s/%s does not exist"
+                    % (username, project_slug))
+        count = TaskSearchTerm.objects.rebuild(project)
+        if int(options.get('verbosity', 1)) >= 1:
+            print "[INFO] Indexed %d task(s)" % count
@@ -0,0 +1,19 @@
+from django.core.management.base import NoArgsCommand
+
+from projector.models import Project
+
+
+class Command(NoArgsCommand):
+    help = ("Recomputes task counters of projects, milestones and statuses")
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        for project in Project.objects.iterator():
+            project.recount_tasks()
+            if verbosity >= 2:
+                print "[INFO] Project %s: %d task(s), %d resolved"\
+                    % (project, project.task_count,
+                       project.resolved_task_count)
+        if verbosity >= 1:
+            print "[INFO] Task counters recomputed"
+
@@ -0,0 +1,37 @@
+from django.core.management.base import NoArgsCommand
+
+from projector.models import Task, TaskRevision
+
+
+class Command(NoArgsCommand):
+    help = ("Computes and stores changes of task revisions created before "
+            "changes were persisted and truncates descriptions stored within "
+            "changes before they were truncated")
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        updated = 0
+        tasks = Task.objects\
+            .filter(taskrevision__changes__isnull=True)\
+            .distinct()
+        for task in tasks.iterator():
+            count = task.store_revision_changes()
+            if verbosity >= 2:
+                print "[INFO] Stored changes of %d revision(s) of task %s"\
+                    % (count, task)
+            updated += count
+        if verbosity >= 1:
+            print "[INFO] Stored changes of %d revision(s)" % updated
+
+        truncated = 0
+        revisions = TaskRevision.objects\
+            .filter(changes__isnull=False)\
+            .defer('description', 'description_delta')
+        for revision in revisions.iterator():
+            changes = Task.truncate_changes(revision.changes)
+            if changes != revision.changes:
+                TaskRevision.objects.filter(pk=revision.pk)\
+                    .update(changes=changes)
+                truncated += 1
+        if verbosity >= 1:
+            print "[INFO] Truncated changes of %d revision(s)" % truncated
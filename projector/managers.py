@@ -1,11 +1,24 @@
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.db import IntegrityError
-from django.db.models import Q
+from django.db.models import F, Max, Q
+from django.db.models.query import QuerySet
 from django.core.exceptions import ValidationError
-from django.contrib.auth.models import AnonymousUser, Group
+from django.contrib.auth.models import AnonymousUser, Group, User
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.template.loader import render_to_string
+from django.utils.datastructures import SortedDict
+from django.utils.translation import ungettext
 
 from projector.signals import setup_project
+from projector.utils.database import bulk_insert
+from projector.utils.search import get_term_weights, get_terms
 
 from richtemplates.shortcuts import get_first_or_None
 
@@ -16,24 +29,40 @@ class ProjectManager(models.Manager):
         Returns queryset of :model:`Project` instances available for given
         user. If no user is given or user is inactive/anonymous, only public
         projects are returned.
+
+        Projects user is member of (directly or by team) are selected by
+        subqueries rather than joins, so no ``DISTINCT`` is needed.
         """
         if not user:
             user = AnonymousUser()
         qs = self.get_query_set()
-        qset = Q()
         if user.is_active:
-            qset = qset & \
-                Q(public=True) | \
-                Q(public=False, membership__member=user) | \
-                Q(public=False, team__group__user=user)
+            qs = qs.filter(Q(public=True) | self._get_membership_q(user))
         else:
-            qset = qset & Q(public=True)
-        qs = qs.filter(qset)\
-            .select_related('membership__member')\
-            .order_by('name')\
-            .distinct()
+            qs = qs.filter(public=True)
+        return qs.order_by('name')
 
-        return qs
+    def with_related(self):
+        """
+        Returns queryset of :model:`Project` instances with author and
+        repository fetched by the same query. Project's config cannot be
+        joined (it is related by a foreign key from :model:`Config`) but is
+        read from the cache by ``Project.get_config``, so usually whole set
+        costs a single query.
+        """
+        return self.get_query_set().select_related('author', 'repository')
+
+    def _get_membership_q(self, user):
+        """
+        Returns ``Q`` object matching projects which given ``user`` is member
+        of, directly or as a member of project's team. Those are read from
+        :model:`ProjectVisibility` table.
+        """
+        from projector.models import ProjectVisibility
+        visible = ProjectVisibility.objects\
+            .filter(user=user)\
+            .values('project')
+        return Q(pk__in=visible)
 
     def for_member(self, user, requested_by):
         """
@@ -41,22 +70,11 @@ class ProjectManager(models.Manager):
         member of with exclusion of those projects which ``requested_by`` user
         cannot see (i.e. are private and ``requested_by`` is not member of).
         """
-        qs = self.for_user(requested_by)
-        qset = Q()
-
         if user.is_anonymous():
             raise ValueError("Only requeted_by parameter may be anonymous")
 
-        qset = qset & \
-            Q(membership__member=user) | \
-            Q(team__group__user=user)
-
-        qs = qs.filter(qset)\
-            .select_related('membership__member')\
-            .order_by('name')\
-            .distinct()
-
-        return qs
+        return self.for_user(requested_by)\
+            .filter(self._get_membership_q(user))
 
     def create_project(self, vcs_alias=None, workflow=None, *args, **kwargs):
         """
@@ -83,6 +101,67 @@ class ProjectManager(models.Manager):
         return queryset
 
 
+class ProjectVisibilityManager(models.Manager):
+
+    def get_expected(self, users=None, projects=None):
+        """
+        Returns set of ``(user_pk, project_pk, via)`` tuples computed from
+        :model:`Membership` and :model:`Team` tables, optionally limited to
+        given users and/or projects (lists of primary keys or instances).
+        """
+        from projector.models import Membership, Team, Visibility
+        memberships = Membership.objects.all()
+        teams = Team.objects.filter(group__user__isnull=False)
+        if users is not None:
+            memberships = memberships.filter(member__in=users)
+            teams = teams.filter(group__user__in=users)
+        if projects is not None:
+            memberships = memberships.filter(project__in=projects)
+            teams = teams.filter(project__in=projects)
+        rows = set((user_pk, project_pk, Visibility.MEMBERSHIP)
+            for user_pk, project_pk in memberships.values_list('member',
+                'project'))
+        rows.update((user_pk, project_pk, Visibility.TEAM)
+            for user_pk, project_pk in teams.values_list('group__user',
+                'project'))
+        return rows
+
+    def get_actual(self, users=None, projects=None):
+        """
+        Returns set of ``(user_pk, project_pk, via)`` tuples currently stored,
+        optionally limited to given users and/or projects.
+        """
+        queryset = self.get_query_set()
+        if users is not None:
+            queryset = queryset.filter(user__in=users)
+        if projects is not None:
+            queryset = queryset.filter(project__in=projects)
+        return set(queryset.values_list('user', 'project', 'via'))
+
+    def check(self, users=None, projects=None):
+        """
+        Returns pair of sets: rows missing at the table and stale rows which
+        should not be there. Both are empty if table is consistent.
+        """
+        expected = self.get_expected(users, projects)
+        actual = self.get_actual(users, projects)
+        return expected - actual, actual - expected
+
+    def refresh(self, users=None, projects=None):
+        """
+        Brings rows of given users and/or projects (or whole table, if none
+        is given) up to date with :model:`Membership` and :model:`Team`
+        tables. Returns pair of numbers of added and removed rows.
+        """
+        missing, stale = self.check(users, projects)
+        for user_pk, project_pk, via in stale:
+            self.filter(user=user_pk, project=project_pk, via=via).delete()
+        bulk_insert(self.model, [self.model(user_id=user_pk,
+                project_id=project_pk, via=via)
+            for user_pk, project_pk, via in missing])
+        return len(missing), len(stale)
+
+
 class TaskManager(models.Manager):
 
     def get_for_project(self, project):
@@ -106,6 +185,417 @@ class TaskManager(models.Manager):
         )
         return task
 
+    def search(self, query, project=None):
+        """
+        Returns queryset of :model:`Task` instances containing all terms of
+        the given ``query`` (at summary, description or revision comments)
+        using :model:`TaskSearchTerm` index. Tasks are ordered by relevance,
+        available as ``search_rank`` attribute - sum of weights of matched
+        terms. If ``query`` has no terms, empty queryset is returned.
+
+        :param query: text to search for
+        :param project: if given, only tasks of this project are returned
+        """
+        from projector.models import TaskSearchTerm
+        queryset = self.get_query_set()
+        if project is not None:
+            queryset = queryset.filter(project=project)
+        terms = sorted(set(get_terms(query)))
+        if not terms:
+            return queryset.none()
+        qn = connection.ops.quote_name
+        task_pk = '%s.%s' % (qn(self.model._meta.db_table),
+            qn(self.model._meta.pk.column))
+        index = qn(TaskSearchTerm._meta.db_table)
+        task_id, term = qn('task_id'), qn('term')
+        placeholders = ', '.join(['%s'] * len(terms))
+        matching = ('%s IN (SELECT %s FROM %s WHERE %s IN (%s) GROUP BY %s '
+            'HAVING COUNT(DISTINCT %s) = %d)' % (task_pk, task_id, index, term,
+            placeholders, task_id, term, len(terms)))
+        rank = ('SELECT SUM(%s) FROM %s WHERE %s.%s = %s AND %s.%s IN (%s)' % (
+            qn('weight'), index, index, task_id, task_pk, index, term,
+            placeholders))
+        return queryset.extra(select={'search_rank': rank},
+            select_params=terms, where=[matching], params=terms)\
+            .order_by('-search_rank')
+
+    def bulk_import(self, project, tasks, batch_size=500, notify=True):
+        """
+        Imports given tasks into the ``project``. Tasks are processed in
+        batches - for each batch block of task ids is reserved and tasks,
+        their initial revisions and activity stream actions are inserted with
+        one statement per table. Each batch is committed as a whole, so if
+        import fails, previous batches remain imported completely and
+        nothing of the failed batch is left.
+
+        ``save`` is not called for imported tasks, which means no signals are
+        sent and no per task notifications are made. Instead, if ``notify``
+        is ``True``, project's watchers get one summary message at the end.
+
+        :param project: :model:`Project` instance
+        :param tasks: iterable of unsaved :model:`Task` instances; ``author``
+          and all required relations should be set (see ``get_for_project``),
+          ``editor`` defaults to ``author``
+        :param batch_size: number of tasks inserted at once
+        :param notify: if ``True``, summary message is sent to project's
+          watchers
+
+        :returns: number of imported tasks
+        """
+        imported = 0
+        first_id, last_id = None, None
+        batch = []
+        for task in tasks:
+            batch.append(task)
+            if len(batch) == batch_size:
+                ids = self._import_batch(project, batch)
+                first_id = first_id or ids[0]
+                last_id = ids[1]
+                imported += len(batch)
+                batch = []
+        if batch:
+            ids = self._import_batch(project, batch)
+            first_id = first_id or ids[0]
+            last_id = ids[1]
+            imported += len(batch)
+        if notify and imported:
+            self._notify_imported(project, imported, first_id, last_id)
+        return imported
+
+    @transaction.commit_on_success
+    def _import_batch(self, project, tasks):
+        """
+        Inserts one batch of tasks (within a transaction) and returns tuple of
+        the first and the last id used.
+        """
+        from projector.models import Action, TaskIdSequence, TaskRevision
+        from projector.models import TaskSearchTerm
+        first_id = TaskIdSequence.objects.reserve(project, len(tasks))
+        last_id = first_id + len(tasks) - 1
+        for i, task in enumerate(tasks):
+            task.project = project
+            task.id = first_id + i
+            task.revision = 0
+            if task.editor_id is None:
+                task.editor = task.author
+                task.editor_ip = task.author_ip
+        bulk_insert(self.model, tasks)
+
+        pks = dict(self.get_query_set()\
+            .filter(project=project, id__range=(first_id, last_id))\
+            .values_list('id', 'id_pk'))
+        ctype = ContentType.objects.get_for_model(self.model)
+        revisions, actions = [], []
+        for task in tasks:
+            task.id_pk = pks[task.id]
+            revision = task.build_revision()
+            revision.created_at = task.created_at
+            revision.changes = SortedDict()
+            revisions.append(revision)
+            actions.append(Action(project=project, verb="created new task",
+                author_id=task.editor_id, action_object_content_type=ctype,
+                action_object_pk=task.pk))
+        bulk_insert(TaskRevision, revisions)
+        bulk_insert(Action, actions)
+        TaskSearchTerm.objects.index_tasks(tasks)
+        self.model.update_counters(project.pk, [
+            (None, (task.status_id, task.milestone_id)) for task in tasks])
+        return first_id, last_id
+
+    def _notify_imported(self, project, count, first_id, last_id):
+        recipient_list = set(project.get_watchers()\
+            .values_list('email', flat=True))
+        if not recipient_list:
+            return
+        subject = u'[%s] %d task(s) imported' % (project.name, count)
+        task_list_url = 'http://%s%s' % (Site.objects.get_current().domain,
+            project.get_task_list_url())
+        message = render_to_string('projector/project/task/import_mail.html', {
+            'project': project,
+            'task_list_url': task_list_url,
+            'count': count,
+            'first_id': first_id,
+            'last_id': last_id,
+        })
+        send_mail(subject=subject, message=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=list(recipient_list))
+
+
+class TaskIdSequenceManager(models.Manager):
+
+    def reserve(self, project, count=1):
+        """
+        Reserves ``count`` consecutive :model:`Task` ids for the given
+        ``project`` and returns the first of them. Project's counter row is
+        advanced by single ``UPDATE`` statement, which locks the row, and
+        read back within the same transaction - concurrent callers (web
+        workers, importers) wait until the transaction ends, so they never
+        get overlapping ranges. If transaction is not managed by the caller,
+        reservation is made (and committed) within its own transaction;
+        otherwise caller's transaction is used and the row stays locked
+        until it ends.
+
+        Reserved ids are never given back, so if task creation fails after
+        reservation there would be a gap in project's numbering.
+
+        :param project: :model:`Project` instance
+        :param count: number of ids to reserve, defaults to ``1``
+        :returns: first reserved id; reserved range is
+          ``first, first + 1, ..., first + count - 1``
+        """
+        if count < 1:
+            raise ValueError("At least one task id has to be reserved")
+        if transaction.is_managed():
+            return self._reserve(project, count)
+        return transaction.commit_on_success(self._reserve)(project, count)
+
+    def _reserve(self, project, count):
+        queryset = self.get_query_set().filter(project=project)
+        if not queryset.update(last_id=F('last_id') + count):
+            self._create_for_project(project)
+            queryset.update(last_id=F('last_id') + count)
+        last_id = queryset.values_list('last_id', flat=True)[0]
+        return last_id - count + 1
+
+    def _create_for_project(self, project):
+        """
+        Creates counter row for the given ``project``. Counter starts from the
+        highest task id already used within the project so it is safe to call
+        for projects created before sequences were introduced. If other
+        process has created the row in the meantime, nothing is done.
+        """
+        from projector.models import Task
+        last_id = Task.objects.filter(project=project)\
+            .aggregate(Max('id'))['id__max'] or 0
+        sid = transaction.savepoint()
+        try:
+            self.create(project=project, last_id=last_id)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+
+
+class TaskSearchTermManager(models.Manager):
+
+    def index_task(self, task):
+        """
+        Replaces indexed terms of the given task's summary and description.
+        """
+        self.filter(task=task, is_comment=False).delete()
+        self.index_tasks([task])
+
+    def index_tasks(self, tasks):
+        """
+        Indexes summary and description of the given (saved) tasks. Terms
+        indexed previously are not removed.
+        """
+        terms = []
+        for task in tasks:
+            terms.extend(self._build_terms(task.pk,
+                (task.summary, self.model.SUMMARY_WEIGHT),
+                (task.description, self.model.DESCRIPTION_WEIGHT)))
+        bulk_insert(self.model, terms)
+
+    def index_comment(self, revision):
+        """
+        Indexes comment of the given :model:`TaskRevision`.
+        """
+        terms = self._build_terms(revision.task_id,
+            (revision.comment, self.model.COMMENT_WEIGHT), is_comment=True)
+        bulk_insert(self.model, terms)
+
+    def rebuild(self, project=None, chunk_size=500):
+        """
+        Removes index entries and indexes all tasks (of the given ``project``
+        only, if specified) again. Tasks are processed in chunks of
+        ``chunk_size``. Returns number of indexed tasks.
+        """
+        from projector.models import Task, TaskRevision
+        tasks = Task.objects.order_by('pk')\
+            .only('id_pk', 'summary', 'description')
+        if project is not None:
+            tasks = tasks.filter(project=project)
+        self._delete_for_project(project)
+
+        count, last_pk = 0, 0
+        while True:
+            chunk = list(tasks.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            self.index_tasks(chunk)
+            pks = [task.pk for task in chunk]
+            comments = TaskRevision.objects\
+                .filter(task__in=pks)\
+                .exclude(comment=None)\
+                .exclude(comment='')\
+                .values_list('task', 'comment')
+            terms = []
+            for task_pk, comment in comments:
+                terms.extend(self._build_terms(task_pk,
+                    (comment, self.model.COMMENT_WEIGHT), is_comment=True))
+            bulk_insert(self.model, terms)
+            count += len(chunk)
+            last_pk = pks[-1]
+        return count
+
+    def _build_terms(self, task_pk, *weighted_texts, **kwargs):
+        is_comment = kwargs.get('is_comment', False)
+        return [self.model(task_id=task_pk, term=term, weight=weight,
+                is_comment=is_comment)
+            for term, weight in get_term_weights(*weighted_texts).items()]
+
+    def _delete_for_project(self, project=None):
+        """
+        Deletes entries (of the given ``project`` only, if specified) with
+        single statement - index entries have no dependent objects, so there
+        is no need to fetch them first, as ``QuerySet.delete`` does.
+        """
+        from projector.models import Task
+        qn = connection.ops.quote_name
+        sql = 'DELETE FROM %s' % qn(self.model._meta.db_table)
+        params = []
+        if project is not None:
+            sql += ' WHERE %s IN (SELECT %s FROM %s WHERE %s = %%s)' % (
+                qn('task_id'), qn(Task._meta.pk.column),
+                qn(Task._meta.db_table), qn('project_id'))
+            params.append(project.pk)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        transaction.commit_unless_managed()
+
+
+class TaskNotificationManager(models.Manager):
+
+    def queue(self, task, users, since_revision=None):
+        """
+        Stores notifications about the ``task`` for those of ``users``
+        (queryset) who are subscribed to digests. ``since_revision`` defaults
+        to the current task's revision.
+
+        :returns: list of primary keys of subscribed users - they should not
+          be notified immediately
+        """
+        if since_revision is None:
+            since_revision = task.revision
+        user_pks = list(users\
+            .filter(digest_subscription__isnull=False)\
+            .values_list('pk', flat=True)\
+            .distinct())
+        now = datetime.datetime.now()
+        bulk_insert(self.model, [self.model(user_id=user_pk, task_id=task.pk,
+            revision=since_revision, created_at=now) for user_pk in user_pks])
+        return user_pks
+
+    def flush(self, frequency, connection=None, chunk_size=500):
+        """
+        Sends pending notifications of users subscribed to digests with given
+        ``frequency`` - each user gets one message covering all tasks changed
+        since the last digest. Tasks user is not allowed to be notified about
+        any more (see ``Task.filter_recipients``) are skipped. All messages
+        are sent through one ``connection`` (opened if not given) and
+        notifications of each user are removed right after user's message is
+        sent, so if sending fails, digests already sent would not be sent
+        again.
+
+        :returns: number of sent messages
+        """
+        from projector.models import Task
+        notifications = self\
+            .filter(user__digest_subscription__frequency=frequency)\
+            .values_list('pk', 'user', 'task', 'revision')
+        # Maps user's pk to list of notifications' pks and dictionary of
+        # tasks' pks and the lowest revision
+        pending = {}
+        for pk, user_pk, task_pk, revision in notifications:
+            pks, revisions = pending.setdefault(user_pk, ([], {}))
+            pks.append(pk)
+            revisions[task_pk] = min(revisions.get(task_pk, revision),
+                revision)
+        if not pending:
+            return 0
+
+        # Maps task's pk to set of pks of users who should be notified
+        task_users = {}
+        for user_pk, (pks, revisions) in pending.items():
+            for task_pk in revisions:
+                task_users.setdefault(task_pk, set()).add(user_pk)
+        tasks = Task.objects\
+            .select_related('project__author', 'author', 'status',
+                'priority', 'component')\
+            .in_bulk(task_users.keys())
+        for task_pk, task in tasks.items():
+            # Users could be removed from private project meanwhile
+            recipients = task.filter_recipients(
+                User.objects.filter(pk__in=task_users[task_pk]))
+            task_users[task_pk] = set(recipients.values_list('pk', flat=True))
+        users = User.objects.in_bulk(pending.keys())
+
+        if connection is None:
+            connection = get_connection()
+        opened = connection.open()
+        sent = 0
+        try:
+            for user_pk, (pks, revisions) in sorted(pending.items()):
+                user = users.get(user_pk)
+                items = [(tasks[task_pk],
+                    tasks[task_pk].get_long_content(revision))
+                    for task_pk, revision in sorted(revisions.items())
+                    if task_pk in tasks and user_pk in task_users[task_pk]]
+                if user is not None and user.email and items:
+                    subject = ungettext('%(count)d task changed',
+                        '%(count)d tasks changed', len(items)) % {
+                        'count': len(items)}
+                    body = render_to_string(
+                        'projector/project/task/digest_mail.html',
+                        {'user': user, 'items': items})
+                    sent += connection.send_messages([EmailMessage(subject,
+                        body, settings.DEFAULT_FROM_EMAIL, [user.email])]) or 0
+                for start in xrange(0, len(pks), chunk_size):
+                    self.filter(pk__in=pks[start:start + chunk_size]).delete()
+        finally:
+            if opened:
+                connection.close()
+        return sent
+
+
+class MilestoneQuerySet(QuerySet):
+
+    def with_progress(self):
+        """
+        Annotates milestones with exact number of all and resolved tasks
+        (as ``progress_task_count`` and ``progress_resolved_task_count``
+        attributes) computed by the same query which fetches milestones.
+        :model:`Milestone`'s progress methods prefer those values over
+        maintained task counters.
+        """
+        from projector.models import Status, Task
+        qn = connection.ops.quote_name
+        milestone_pk = '%s.%s' % (qn(self.model._meta.db_table),
+            qn(self.model._meta.pk.column))
+        task = qn(Task._meta.db_table)
+        status = qn(Status._meta.db_table)
+        total = 'SELECT COUNT(*) FROM %s WHERE %s.%s = %s' % (
+            task, task, qn('milestone_id'), milestone_pk)
+        resolved = ('SELECT COUNT(*) FROM %s INNER JOIN %s ON %s.%s = %s.%s '
+            'WHERE %s.%s = %s AND %s.%s = %%s' % (
+            task, status, task, qn('status_id'), status, qn('id'),
+            task, qn('milestone_id'), milestone_pk, status, qn('is_resolved')))
+        select = SortedDict((
+            ('progress_task_count', total),
+            ('progress_resolved_task_count', resolved),
+        ))
+        return self.extra(select=select, select_params=(True,))
+
+
+class MilestoneManager(models.Manager):
+
+    def get_query_set(self):
+        return MilestoneQuerySet(self.model)
+
+    def with_progress(self):
+        return self.get_query_set().with_progress()
+
 
 class TeamManager(models.Manager):
 
@@ -125,6 +615,7 @@ class TeamManager(models.Manager):
         his or her profile would simply get ``team`` attribute set to newly
         created ``Team`` and ``is_team`` attribute would be set to ``True``.
         """
+        from projector.core.permissions import bump_user_perms_version
         from projector.models import Project
         if not user.is_active or user.is_anonymous():
             raise ValidationError("Cannot conver anonymous or inactive user")
@@ -139,6 +630,7 @@ class TeamManager(models.Manager):
             user.groups.add(group)
             for project in Project.objects.filter(author=user):
                 self.create(project = project, group = group)
+            bump_user_perms_version(user.pk)
             return group
         except IntegrityError:
             raise ValidationError("Cannot convert user if a group with same "
@@ -147,6 +639,55 @@ class TeamManager(models.Manager):
 
 class WatchedItemManager(models.Manager):
 
+    def watched_ids(self, user, queryset_or_model):
+        """
+        Returns set of primary keys of objects watched by the ``user``,
+        retrieved with one query. Second parameter may be a model class
+        (all watched objects of that model are considered), a queryset or
+        a list of model instances.
+        """
+        if not user or user.is_anonymous():
+            return set()
+        if isinstance(queryset_or_model, QuerySet):
+            model = queryset_or_model.model
+            pks = queryset_or_model.values('pk')
+        elif isinstance(queryset_or_model, type):
+            model, pks = queryset_or_model, None
+        else:
+            objects = list(queryset_or_model)
+            if not objects:
+                return set()
+            model = type(objects[0])
+            pks = [obj.pk for obj in objects]
+        items = self.get_query_set().filter(user=user,
+            content_type=ContentType.objects.get_for_model(model))
+        if pks is not None:
+            items = items.filter(object_id__in=pks)
+        return set(items.values_list('object_id', flat=True))
+
+    def get_watched_ids_cache(self, user, model):
+        """
+        Returns set of primary keys of all ``model`` instances watched by the
+        ``user``. Set is fetched once and memoized at the user object, so
+        checks made while processing one request share it.
+        """
+        cache = getattr(user, '_watched_ids', None)
+        if cache is None:
+            cache = {}
+            user._watched_ids = cache
+        ctype = ContentType.objects.get_for_model(model)
+        if ctype.pk not in cache:
+            cache[ctype.pk] = self.watched_ids(user, model)
+        return cache[ctype.pk]
+
+    def forget_watched_ids(self, user, model):
+        """
+        Removes memoized ids of ``model`` instances watched by the ``user``.
+        """
+        cache = getattr(user, '_watched_ids', None)
+        if cache:
+            cache.pop(ContentType.objects.get_for_model(model).pk, None)
+
     def projects_for_user(self, user):
         """
         Returns Project instances watched by user.
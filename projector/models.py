@@ -14,14 +14,17 @@ from django.contrib.contenttypes import generic
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError, PermissionDenied,\
     ImproperlyConfigured
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.core.urlresolvers import reverse
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, F, Q
 from django.db.models.query import QuerySet
 from django.template.defaultfilters import slugify
 from django.template.loader import render_to_string
+from django.utils import simplejson
 from django.utils.datastructures import SortedDict
+from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timesince import timesince
 
@@ -33,13 +36,19 @@ from projector import settings as projector_settings
 from projector.core.exceptions import ProjectorError
 from projector.core.exceptions import ConfigAlreadyExist
 from projector.core.exceptions import ForkError
+from projector.managers import MilestoneManager
 from projector.managers import ProjectManager
+from projector.managers import ProjectVisibilityManager
 from projector.managers import TaskManager
+from projector.managers import TaskIdSequenceManager
+from projector.managers import TaskNotificationManager
+from projector.managers import TaskSearchTermManager
 from projector.managers import TeamManager
 from projector.managers import WatchedItemManager
 from projector.settings import get_config_value
 from projector.signals import post_fork
 from projector.utils import abspath, str2obj, using_projector_profile
+from projector.utils.delta import apply_delta, make_delta
 from projector.utils.lazy import LazyProperty
 from projector.utils.helpers import Choices
 
@@ -54,6 +63,12 @@ from treebeard.al_tree import AL_Node
 
 PROJECT_VCS_ALIAS_FIELD = '_vcs_alias'
 PROJECT_WORKFLOW_FIELD = '_workflow_obj'
+# Rendered task mails are cached per revision so they never become stale
+TASK_MAIL_CACHE_TIMEOUT = 60 * 60
+# Cached configs are removed when changed, but only from the cache of the
+# process which changed them - configs are not cached at all unless the cache
+# is shared (see ``Project.get_config``)
+CONFIG_CACHE_TIMEOUT = 60 * 60 * 24
 
 class WatchedItem(models.Model):
     """
@@ -79,6 +94,7 @@ class Watchable(object):
             content_type = ContentType.objects.get_for_model(self),
             object_id = self.pk,
         )
+        WatchedItem.objects.forget_watched_ids(user, type(self))
         return item, created
 
     def unwatch(self, user):
@@ -87,24 +103,34 @@ class Watchable(object):
             content_type = ContentType.objects.get_for_model(self),
             object_id = self.pk,
         ).delete()
+        WatchedItem.objects.forget_watched_ids(user, type(self))
 
     def is_watched(self, user):
-        if isinstance(user, AnonymousUser):
-            return False
-        try:
-            WatchedItem.objects.get(
-                user = user,
-                content_type = ContentType.objects.get_for_model(self),
-                object_id = self.pk)
-            return True
-        except WatchedItem.DoesNotExist:
+        """
+        Returns ``True`` if given user watches this object. Ids of all
+        objects of the same type watched by the user are fetched at the first
+        call and memoized at the user object (see
+        ``WatchedItemManager.get_watched_ids_cache``), so checking many
+        objects costs only one query.
+        """
+        if user.is_anonymous():
             return False
+        return self.pk in WatchedItem.objects.get_watched_ids_cache(user,
+            type(self))
+
+    def get_watchers_q(self):
+        """
+        Returns ``Q`` object matching users who watch this object, selected
+        by subquery.
+        """
+        watched = WatchedItem.objects.filter(
+            content_type = ContentType.objects.get_for_model(self),
+            object_id = self.pk,
+        ).values('user')
+        return Q(pk__in=watched)
 
     def get_watchers(self):
-        users = User.objects.filter(
-            watcheditem__content_type = ContentType.objects.get_for_model(self),
-            watcheditem__object_id = self.pk,
-        )
+        users = User.objects.filter(self.get_watchers_q())
         return users
 
 class DictModel(models.Model):
@@ -128,6 +154,28 @@ class OrderedDictModel(DictModel):
         abstract = True
         ordering = ['order', 'name']
 
+class TaskCounted(object):
+    """
+    Mixin for models with denormalized task counters. Counters are maintained
+    with ``UPDATE`` queries (see ``Task.update_counters``) so they need to be
+    refreshed before instance is saved - otherwise stale values could be
+    written back.
+    """
+    task_counter_fields = ('task_count', 'resolved_task_count')
+
+    def _refresh_task_counters(self):
+        if not self.pk:
+            return
+        values = type(self)._default_manager\
+            .filter(pk=self.pk)\
+            .values_list(*self.task_counter_fields)
+        for row in values:
+            for field, value in zip(self.task_counter_fields, row):
+                setattr(self, field, value)
+
+    def get_open_task_count(self):
+        return self.task_count - self.resolved_task_count
+
 class ProjectCategory(models.Model):
     name = models.CharField(_('name'), max_length=64, unique=True)
     slug = models.SlugField(unique=True, editable=False, max_length=64)
@@ -176,7 +224,7 @@ class State(Choices):
     READY = 100
 
 
-class Project(AL_Node, Watchable):
+class Project(AL_Node, Watchable, TaskCounted):
     """
     Most important model within whole application. It provides connection with
     all other models.
@@ -212,6 +260,12 @@ class Project(AL_Node, Watchable):
     parent = models.ForeignKey('self', related_name='children_set',
        null=True, blank=True, db_index=True)
     fork_url = models.URLField(verify_exists=False, null=True, blank=True)
+    repository_size = models.BigIntegerField(_('repository size'),
+        null=True, blank=True, editable=False)
+    task_count = models.IntegerField(_('task count'), default=0,
+        editable=False)
+    resolved_task_count = models.IntegerField(_('resolved task count'),
+        default=0, editable=False)
 
     node_order_by = ['author', 'name']
 
@@ -254,6 +308,7 @@ class Project(AL_Node, Watchable):
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
         self.full_clean()
+        self._refresh_task_counters()
         project = super(Project, self).save(*args, **kwargs)
         # Add necessary permissions for author - we need to do this
         # *NOT* asynchronousely as instant redirect after project creation
@@ -466,11 +521,29 @@ class Project(AL_Node, Watchable):
         return self.state != State.ERROR and self.state < State.READY
 
     def get_task(self, id):
-        queryset = Task.objects.filter(project=self)
-        if not queryset:
-            # queryset at this point may be evaluated to empty list
-            raise Task.DoesNotExist
-        return queryset.get(id=id)
+        return Task.objects.get(project=self, id=id)
+
+    def get_tasks_by_ids(self, ids):
+        """
+        Returns dictionary mapping given task ids to this project's
+        :model:`Task` instances (with ``status`` fetched) or ``None`` if there
+        is no such task. Missing tasks are fetched with one query and
+        memoized at the project instance, so asking for them again (i.e.
+        while rendering the same page) doesn't hit the database.
+        """
+        if not hasattr(self, '_tasks_by_id'):
+            self._tasks_by_id = {}
+        ids = set(ids)
+        missing = ids.difference(self._tasks_by_id)
+        if missing:
+            tasks = Task.objects\
+                .filter(project=self, id__in=missing)\
+                .select_related('status')
+            for task in tasks:
+                self._tasks_by_id[task.id] = task
+            for id in missing:
+                self._tasks_by_id.setdefault(id, None)
+        return dict((id, self._tasks_by_id[id]) for id in ids)
 
     def get_tasks(self):
         return self.task_set\
@@ -483,6 +556,39 @@ class Project(AL_Node, Watchable):
     def get_closed_tasks(self):
         return self.get_tasks().filter(status__is_resolved=True)
 
+    def recount_tasks(self):
+        """
+        Recomputes task counters of this project, it's milestones and
+        statuses. Counters are maintained whenever task is saved or deleted so
+        this method is needed only to repair them (see ``recount_tasks``
+        management command).
+        """
+        rows = Task.objects\
+            .filter(project=self)\
+            .order_by()\
+            .values('status', 'milestone', 'status__is_resolved')\
+            .annotate(count=Count('id_pk'))
+        self.task_count, self.resolved_task_count = 0, 0
+        milestones, statuses = {}, {}
+        for row in rows:
+            count = row['count']
+            resolved = row['status__is_resolved'] and count or 0
+            self.task_count += count
+            self.resolved_task_count += resolved
+            statuses[row['status']] = statuses.get(row['status'], 0) + count
+            if row['milestone']:
+                total, done = milestones.get(row['milestone'], (0, 0))
+                milestones[row['milestone']] = (total + count, done + resolved)
+        Project.objects.filter(pk=self.pk).update(task_count=self.task_count,
+            resolved_task_count=self.resolved_task_count)
+        self.milestone_set.update(task_count=0, resolved_task_count=0)
+        for pk, (total, done) in milestones.items():
+            Milestone.objects.filter(pk=pk)\
+                .update(task_count=total, resolved_task_count=done)
+        self.status_set.update(task_count=0)
+        for pk, total in statuses.items():
+            Status.objects.filter(pk=pk).update(task_count=total)
+
     def _get_homedir(self):
         """
         Returns directory containing all files related to this project. If
@@ -756,6 +862,7 @@ class Project(AL_Node, Watchable):
             # Update is much faster than save
             self.repository = repository
             Project.objects.filter(pk=self.pk).update(repository=repository)
+            self.update_repository_size()
             return repository
         except VCSError, err:
             traceback_msg = '\n'.join(traceback.format_exception(*
@@ -773,6 +880,23 @@ class Project(AL_Node, Watchable):
             logging.debug("%s created for project %s" % (repository, self))
             self.state = State.REPOSITORY_CREATED
 
+    def update_repository_size(self):
+        """
+        Computes size of the project's repository (walking its directory)
+        and stores it at ``repository_size``, so it is available without
+        touching the repository. Should be called whenever repository
+        changes (it is updated after each push, see
+        ``projector.tasks.update_repository_size``).
+
+        :returns: size in bytes or ``None`` if project has no repository
+        """
+        if self.repository is None:
+            return None
+        self.repository_size = self.repository.info.size
+        Project.objects.filter(pk=self.pk)\
+            .update(repository_size=self.repository_size)
+        return self.repository_size
+
     def create_config(self):
         """
         Creates default configuration for given project.
@@ -794,9 +918,22 @@ class Project(AL_Node, Watchable):
 
     def get_config(self):
         """
-        Returns Config for this project.
-        """
-        return Config.objects.get(project=self)
+        Returns Config for this project. It is memoized at the instance and,
+        if :setting:`PROJECTOR_SHARED_CACHE` is ``True``, kept at Django's
+        cache backend between requests - cached entry is removed whenever
+        the config is saved or deleted (see ``Config.clear_cache``).
+        """
+        if not hasattr(self, '_config'):
+            if get_config_value('SHARED_CACHE'):
+                key = Config.get_cache_key(self.pk)
+                config = cache.get(key)
+                if config is None:
+                    config = Config.objects.get(project=self)
+                    cache.set(key, config, CONFIG_CACHE_TIMEOUT)
+            else:
+                config = Config.objects.get(project=self)
+            self._config = config
+        return self._config
     config = property(get_config)
 
     def setup(self, vcs_alias=None, workflow=None):
@@ -821,11 +958,21 @@ class Project(AL_Node, Watchable):
         if get_config_value('CREATE_REPOSITORIES'):
             self.create_repository(vcs_alias)
 
+    def get_members_q(self):
+        """
+        Returns ``Q`` object matching users who are members of the project
+        (directly or by team, as stored at :model:`ProjectVisibility`) or its
+        author. Sets of ids are selected by subqueries, so no joins
+        multiplying rows (and ``DISTINCT``) are needed.
+        """
+        members = ProjectVisibility.objects\
+            .filter(project=self)\
+            .values('user')
+        return Q(pk__in=members) | Q(pk=self.author_id)
+
     def get_watchers(self):
         watchers = super(Project, self).get_watchers()
-        watchers = watchers.filter(models.Q(
-            membership__project=self) |
-            models.Q(groups__team__project=self))
+        watchers = watchers.filter(self.get_members_q())
         return watchers
 
     def fork(self, user, force_private=False):
@@ -846,7 +993,7 @@ class Project(AL_Node, Watchable):
         """
         if user.is_anonymous() or not user.is_active:
             raise PermissionDenied("Fork is allowed for active users only")
-        if not self in Project.objects.for_user(user):
+        if not self.is_visible_for(user):
             raise PermissionDenied("User is not allowed to fork this project")
         if user == self.author:
             raise ForkError("Author cannot fork own project")
@@ -869,6 +1016,19 @@ class Project(AL_Node, Watchable):
         post_fork.send(sender=self, fork=forked)
         return forked
 
+    def is_visible_for(self, user):
+        """
+        Returns ``True`` if this project would be returned by
+        ``Project.objects.for_user(user)``, without fetching that list.
+        """
+        if self.public:
+            return True
+        if not user or not user.is_active:
+            return False
+        return ProjectVisibility.objects\
+            .filter(user=user, project=self)\
+            .exists()
+
     def get_fork_for_user(self, user):
         """
         Returns fork of this project's root for the given user. If user haven't
@@ -987,6 +1147,16 @@ class Config(models.Model):
     def __unicode__(self):
         return u'<Config for %s>' % self.project
 
+    @staticmethod
+    def get_cache_key(project_pk):
+        return 'projector:config:%s' % project_pk
+
+    def clear_cache(self):
+        """
+        Removes this config from the cache used by ``Project.get_config``.
+        """
+        cache.delete(Config.get_cache_key(self.project_id))
+
 
 class Component(models.Model):
     project = models.ForeignKey(Project)
@@ -1052,7 +1222,8 @@ class Membership(models.Model):
         """
         Returns Permission objects for member, not his/her groups.
         """
-        return get_perms(self.member, self.project)
+        from projector.core.permissions import get_cached_perms
+        return get_cached_perms(self.member, self.project)
 
     @LazyProperty
     def all_perms(self):
@@ -1061,15 +1232,8 @@ class Membership(models.Model):
         his/he groups (to fetch user specific permissions only, use ``perms``
         instead).
         """
-        perms = Permission.objects.filter(
-            models.Q(group__in = self.member.groups.all()) |
-            models.Q(user=self.member)
-        ).filter(
-            approved = True,
-            content_type = ContentType.objects.get_for_model(Project),
-            object_id = self.project_id,
-        )
-        return perms
+        from projector.core.permissions import get_project_perms
+        return get_project_perms(self.member, self.project)
 
     @LazyProperty
     def teams(self):
@@ -1114,9 +1278,44 @@ class Team(models.Model):
 
     @LazyProperty
     def perms(self):
-        return get_perms(self.group, self.project)
+        from projector.core.permissions import get_cached_perms
+        return get_cached_perms(self.group, self.project)
+
+
+class Visibility(Choices):
+    """
+    Represents the way user is related with the project.
+    """
+    MEMBERSHIP = 1
+    TEAM = 2
+
 
-class Milestone(models.Model):
+class ProjectVisibility(models.Model):
+    """
+    Materialized relation between users and projects they are members of,
+    directly (by :model:`Membership`) or as members of project's
+    :model:`Team`. Rows are maintained by signal listeners whenever
+    memberships, teams or users' groups change and are used by
+    :manager:`ProjectManager` to find projects visible for the user. Use
+    ``rebuild_project_visibility`` and ``check_project_visibility`` commands
+    to recreate or verify them.
+    """
+    user = models.ForeignKey(User, verbose_name=_('user'))
+    project = models.ForeignKey(Project, verbose_name=_('project'))
+    via = models.IntegerField(_('via'), choices=Visibility.as_choices())
+
+    objects = ProjectVisibilityManager()
+
+    class Meta:
+        unique_together = ('user', 'project', 'via')
+        verbose_name = _('project visibility')
+        verbose_name_plural = _('project visibilities')
+
+    def __unicode__(self):
+        return u"%s@%s (%s)" % (self.user_id, self.project_id,
+            self.get_via_display())
+
+class Milestone(models.Model, TaskCounted):
     project = models.ForeignKey(Project, verbose_name=_('project'))
     name = models.CharField(max_length=64)
     slug = AutoSlugField(max_length=64, populate_from='name',
@@ -1130,6 +1329,12 @@ class Milestone(models.Model):
             #projector_settings.get_config_value('MILESTONE_DEADLINE_DELTA')))
     date_completed = models.DateField(_('date completed'), null=True,
         blank=True)
+    task_count = models.IntegerField(_('task count'), default=0,
+        editable=False)
+    resolved_task_count = models.IntegerField(_('resolved task count'),
+        default=0, editable=False)
+
+    objects = MilestoneManager()
 
     class Meta:
         ordering = ('created_at',)
@@ -1161,27 +1366,31 @@ class Milestone(models.Model):
         url = _url + '?milestone=%d' % self.pk
         return url
 
+    def save(self, *args, **kwargs):
+        self._refresh_task_counters()
+        return super(Milestone, self).save(*args, **kwargs)
+
     def get_tasks_count(self):
-        return self.task_set.count()
+        """
+        Returns number of milestone's tasks. If milestone was fetched using
+        ``with_progress`` queryset method, annotated value is used -
+        maintained counter otherwise. Same applies to other progress methods.
+        """
+        return getattr(self, 'progress_task_count', self.task_count)
 
     def get_finished_tasks_count(self):
-        finished_tasks = self.task_set\
-            .select_related('status')\
-            .filter(status__is_resolved=True)
-        return finished_tasks.count()
+        return getattr(self, 'progress_resolved_task_count',
+            self.resolved_task_count)
 
     def get_finished_tasks_count_as_percentage(self):
         finished = self.get_finished_tasks_count()
-        all = self.task_set.count()
+        all = self.get_tasks_count()
         if all == 0:
             return 100
         return Decimal(finished) / Decimal(all) * Decimal(100)
 
     def get_unfinished_tasks_count(self):
-        return self.task_set\
-            .select_related('status')\
-            .filter(status__is_resolved=False)\
-            .count()
+        return self.get_tasks_count() - self.get_finished_tasks_count()
 
     def get_unfinished_tasks_count_as_percentage(self):
         return Decimal(100) - self.get_finished_tasks_count_as_percentage()
@@ -1233,6 +1442,25 @@ class Status(OrderedDictModel):
         through='Transition', symmetrical=False, null=True, blank=True)
     slug = AutoSlugField(max_length=64, populate_from='name',
         always_update=True, unique_with='project')
+    task_count = models.IntegerField(_('task count'), default=0,
+        editable=False)
+
+    def save(self, *args, **kwargs):
+        """
+        Refreshes ``task_count`` before saving. If ``is_resolved`` flag has
+        been changed, task counters of the project are recomputed.
+        """
+        resolved_changed = False
+        if self.pk:
+            values = Status.objects.filter(pk=self.pk)\
+                .values_list('task_count', 'is_resolved')
+            for task_count, is_resolved in values:
+                self.task_count = task_count
+                resolved_changed = is_resolved != self.is_resolved
+        status = super(Status, self).save(*args, **kwargs)
+        if resolved_changed and self.task_count:
+            self.project.recount_tasks()
+        return status
 
     def can_change_to(self, new_status):
         """
@@ -1318,6 +1546,25 @@ class AbstractTask(models.Model):
     class Meta:
         abstract = True
 
+class TaskIdSequence(models.Model):
+    """
+    Stores last :model:`Task` id used within a project. Use
+    :manager:`TaskIdSequenceManager`'s ``reserve`` method to claim new ids
+    instead of changing ``last_id`` directly.
+    """
+    project = models.OneToOneField(Project, verbose_name=_('project'),
+        related_name='task_id_sequence')
+    last_id = models.PositiveIntegerField(_('last id'), default=0)
+
+    objects = TaskIdSequenceManager()
+
+    class Meta:
+        verbose_name = _('task id sequence')
+        verbose_name_plural = _('task id sequences')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.project, self.last_id)
+
 class Task(AbstractTask, Watchable):
     id_pk = models.AutoField(primary_key=True)
     id = models.IntegerField(editable=False)
@@ -1343,20 +1590,16 @@ class Task(AbstractTask, Watchable):
 
     def _calculate_id(self):
         """
-        Sets and returns new id for taks within it's project.
+        Sets and returns new id for taks within it's project. Id is reserved
+        using project's :model:`TaskIdSequence` so concurrent task creation
+        never ends up with duplicated ids.
         """
         try:
             self.project # Just check
         except Project.DoesNotExist:
             raise Task.CannotCalucalteIdError("Project is not set for this task")
         if not self.id:
-            try:
-                latest_task = Task.objects\
-                    .filter(project=self.project)\
-                    .order_by('-id')[0]
-                self.id = latest_task.id + 1
-            except IndexError:
-                self.id = 1
+            self.id = TaskIdSequence.objects.reserve(self.project)
         logging.debug("Task calulated id is %s" % self.id)
         return self.id
 
@@ -1397,7 +1640,74 @@ class Task(AbstractTask, Watchable):
         if self.pk:
             # Task update
             self.revision += 1
-        return super(Task, self).save(*args, **kwargs)
+            old_state = self._get_counted_state()
+        else:
+            old_state = None
+        task = super(Task, self).save(*args, **kwargs)
+        new_state = (self.status_id, self.milestone_id)
+        if old_state != new_state:
+            Task.update_counters(self.project_id, [(old_state, new_state)])
+        self._counted_state = new_state
+        return task
+
+    def _get_counted_state(self):
+        """
+        Returns ``(status_id, milestone_id)`` tuple of this task as it is
+        stored at the database. State is remembered when task is fetched
+        (see ``projector.listeners.task_init_listener``) or queried if not
+        available.
+        """
+        state = getattr(self, '_counted_state', None)
+        if state is None:
+            try:
+                state = Task.objects.filter(pk=self.pk)\
+                    .values_list('status', 'milestone')[0]
+            except IndexError:
+                pass
+        return state
+
+    @staticmethod
+    def update_counters(project_id, changes):
+        """
+        Updates task counters of the project, milestones and statuses.
+
+        :param project_id: primary key of the project the tasks belong to
+        :param changes: list of ``(old, new)`` pairs, where both elements
+          are ``(status_id, milestone_id)`` tuples describing task before and
+          after change (``None`` for created or deleted task)
+        """
+        status_ids = set()
+        for pair in changes:
+            for state in pair:
+                if state:
+                    status_ids.add(state[0])
+        if not status_ids:
+            return
+        resolved = set(Status.objects\
+            .filter(pk__in=status_ids, is_resolved=True)\
+            .values_list('pk', flat=True))
+        deltas = {}
+        for old, new in changes:
+            for state, sign in ((old, -1), (new, 1)):
+                if state is None:
+                    continue
+                status_id, milestone_id = state
+                done = status_id in resolved and sign or 0
+                keys = [(Project, project_id), (Status, status_id)]
+                if milestone_id:
+                    keys.append((Milestone, milestone_id))
+                for key in keys:
+                    total, resolved_total = deltas.get(key, (0, 0))
+                    deltas[key] = (total + sign, resolved_total + done)
+        for (model, pk), (total, resolved_total) in deltas.items():
+            update = {}
+            if total:
+                update['task_count'] = F('task_count') + total
+            if resolved_total and model is not Status:
+                update['resolved_task_count'] = \
+                    F('resolved_task_count') + resolved_total
+            if update:
+                model.objects.filter(pk=pk).update(**update)
 
     def _set_comment(self, comment):
         self._comment = comment
@@ -1420,6 +1730,10 @@ class Task(AbstractTask, Watchable):
         'priority',
         'type',
     )
+    # Full texts are kept by revisions themselves - changes of these fields
+    # only store their beginnings
+    CHANGESET_TRUNCATED_FIELDS = ('description',)
+    CHANGESET_TRUNCATE_LENGTH = 50
 
     def fetch_old(self):
         return Task.objects.get(pk=self.pk)
@@ -1450,31 +1764,66 @@ class Task(AbstractTask, Watchable):
     def get_revisions(self, force_query=False):
         """
         Returns TaskRevision objects related to this Task instance.
-        Each TaskRevision would have additional attribute ``changes``
-        which would containt result of ``Task.diff`` method. For
-        first revision changes would be empty dict.
+        Each TaskRevision has ``changes`` attribute containing result of
+        ``Task.get_changes`` against the previous revision, stored at the
+        database. For first revision changes would be empty dict.
+        Descriptions stored as deltas are restored.
         """
         if force_query or not hasattr(self, '_revisions'):
-            revisions = self.taskrevision_set\
-                .select_related('type', 'author', 'status', 'editor', 'task',
-                    'priority', 'milestone', 'component', 'owner',
-                    'task__project')\
-                .order_by('revision')
-            for i, revision in enumerate(revisions):
-                if i==0:
-                    revision.changes = {}
-                else:
-                    revision.changes = Task.diff(revisions[i-1], revision)
+            revisions = list(self.taskrevision_set\
+                .select_related('author')\
+                .order_by('revision'))
+            TaskRevision.restore_descriptions(revisions)
+            self.store_revision_changes(revisions)
             self._revisions = revisions
         return self._revisions
 
     revisions = property(get_revisions)
 
-    def create_revision(self):
+    def get_revision_window(self, before=None, limit=None):
+        """
+        Returns tuple of list of revisions and cursor of the next window.
+        List contains at most ``limit`` revisions (defaults to
+        :setting:`PROJECTOR_TASK_REVISIONS_PAGINATE_BY`) with numbers lower
+        than ``before`` (or newest revisions if ``before`` is ``None``),
+        ordered from the newest one. Cursor should be passed as ``before``
+        parameter in order to retrieve next (older) window - if there are no
+        more revisions it is ``None``.
+
+        As ``changes`` are stored at each revision they are available
+        regardless of window boundaries.
+        """
+        if limit is None:
+            limit = get_config_value('TASK_REVISIONS_PAGINATE_BY')
+        queryset = self.taskrevision_set\
+            .select_related('author')\
+            .order_by('-revision')
+        if before is not None:
+            queryset = queryset.filter(revision__lt=before)
+        revisions = list(queryset[:limit + 1])
+        if len(revisions) > limit:
+            revisions = revisions[:limit]
+            cursor = revisions[-1].revision
+        else:
+            cursor = None
+        window = revisions[::-1]
+        if window and not window[-1].is_snapshot():
+            window += window[-1].get_successors_to_snapshot()
+        TaskRevision.restore_descriptions(window)
+        return revisions, cursor
+
+    @models.permalink
+    def get_revisions_url(self):
+        return ('projector_task_revisions', (), {
+            'username': self.project.author.username,
+            'project_slug': self.project.slug,
+            'task_id': self.id,
+        })
+
+    def build_revision(self):
         """
-        Creates revision (instance of ``TaskRevision``) for this task. If
-        comment has been set, it would be used in revision creation
-        process.
+        Returns new, unsaved revision (instance of ``TaskRevision``) for this
+        task. If comment has been set, it would be used.
         """
         revision_info = dict(
             task = self,
@@ -1494,28 +1843,204 @@ class Task(AbstractTask, Watchable):
         )
         if self.comment is not None:
             revision_info['comment'] = self.comment
-        revision = TaskRevision.objects.create(**revision_info)
+        return TaskRevision(**revision_info)
+
+    def create_revision(self):
+        """
+        Creates revision (instance of ``TaskRevision``) for this task. If
+        comment has been set, it would be used in revision creation
+        process. Description of the previous revision is replaced with
+        a delta against the new one (see ``compact_revisions``).
+        """
+        try:
+            previous = self.taskrevision_set\
+                .filter(revision__lt=self.revision)\
+                .order_by('-revision')[0]
+        except IndexError:
+            previous = None
+        revision = self.build_revision()
+        revision.changes = Task.get_changes(previous, self)
+        revision.save()
         logging.debug("TaskRevision created: %s" % revision)
+        self._compact_revision(self.revision - 1)
         if hasattr(self, '_revisions'):
             self._revisions.append(revision)
         return revision
 
-    def get_long_summary(self):
-        raw = self.project.config.task_email_summary_format
-        tmpl = string.Template(raw)
-        return tmpl.safe_substitute(project=self.project.name,
-            id=self.id, summary=self.summary)
+    @staticmethod
+    def get_changes(previous, current):
+        """
+        Returns differences between ``previous`` and ``current`` tasks (or
+        revisions) as ``SortedDict``. Changed fields (from
+        ``CHANGESET_FIELDS``) would become keys and tuples of current and
+        previous values (as unicode or ``None``) would be dict's values.
+        Related objects are fetched for changed fields only. If ``previous``
+        is ``None``, empty dict is returned. Values of
+        ``CHANGESET_TRUNCATED_FIELDS`` are truncated (see
+        ``get_change_value``).
+        """
+        changes = SortedDict()
+        if previous is None:
+            return changes
+        for name in Task.CHANGESET_FIELDS:
+            attname = Task._meta.get_field(name).attname
+            if getattr(previous, attname) != getattr(current, attname):
+                changes[name] = tuple(Task.get_change_value(name,
+                    getattr(obj, name)) for obj in (current, previous))
+        return changes
 
-    def get_long_content(self):
+    @staticmethod
+    def get_change_value(name, value):
         """
-        Returns content of the task, suitable as email message's body.
+        Returns ``value`` of the field ``name`` as stored at revision changes
+        (unicode or ``None``). Values of ``CHANGESET_TRUNCATED_FIELDS``
+        longer than ``CHANGESET_TRUNCATE_LENGTH`` are truncated (and
+        ellipsis is appended).
         """
-        task_url = 'http://%s%s' % (Site.objects.get_current().domain,
-            self.get_absolute_url())
-        result = render_to_string('projector/project/task/mail.html', {
-            'task': self,
-            'task_url': task_url,
-        })
+        value = value is not None and force_unicode(value) or None
+        if name in Task.CHANGESET_TRUNCATED_FIELDS and value and \
+                len(value) > Task.CHANGESET_TRUNCATE_LENGTH:
+            value = value[:Task.CHANGESET_TRUNCATE_LENGTH] + u'...'
+        return value
+
+    @staticmethod
+    def truncate_changes(changes):
+        """
+        Returns copy of ``changes`` (as returned by ``get_changes``) with
+        values of ``CHANGESET_TRUNCATED_FIELDS`` truncated - for changes
+        stored before they were truncated.
+        """
+        truncated = SortedDict()
+        for name, values in changes.items():
+            truncated[name] = tuple(Task.get_change_value(name, value)
+                for value in values)
+        return truncated
+
+    def store_revision_changes(self, revisions=None):
+        """
+        Computes and persists ``changes`` of revisions which don't have them
+        stored yet (created before ``changes`` were introduced).
+        ``revisions`` should be a list of all revisions of this task, ordered
+        by revision number, with descriptions restored - if not given, they
+        are fetched.
+
+        :returns: number of updated revisions
+        """
+        if revisions is None:
+            revisions = list(self.taskrevision_set.order_by('revision'))
+            TaskRevision.restore_descriptions(revisions)
+        updated = 0
+        for i, revision in enumerate(revisions):
+            if revision.changes is not None:
+                continue
+            previous = i and revisions[i-1] or None
+            revision.changes = Task.get_changes(previous, revision)
+            TaskRevision.objects.filter(pk=revision.pk)\
+                .update(changes=revision.changes)
+            updated += 1
+        return updated
+
+    def _compact_revision(self, number):
+        """
+        Replaces description of revision with given ``number`` with a delta
+        against current description. Should be called only right after newer
+        revision has been created.
+        """
+        interval = get_config_value('TASK_REVISION_SNAPSHOT_INTERVAL')
+        if not interval or number < 0 or number % interval == 0:
+            return
+        queryset = self.taskrevision_set\
+            .filter(revision=number, description_delta=None)
+        try:
+            description = queryset.values_list('description', flat=True)[0]
+        except IndexError:
+            return
+        delta = make_delta(self.description, description)
+        if len(delta) < len(description):
+            queryset.update(description='', description_delta=delta)
+
+    def compact_revisions(self):
+        """
+        Stores descriptions of all revisions of this task as deltas, except
+        the newest revision and snapshots (each revision which number is
+        a multiple of :setting:`PROJECTOR_TASK_REVISION_SNAPSHOT_INTERVAL`).
+        Delta is not stored if it wouldn't be shorter than the description
+        itself.
+
+        :returns: number of compacted revisions
+        """
+        interval = get_config_value('TASK_REVISION_SNAPSHOT_INTERVAL')
+        if not interval:
+            return 0
+        rows = self.taskrevision_set\
+            .order_by('-revision')\
+            .values_list('pk', 'revision', 'description', 'description_delta')
+        compacted = 0
+        successor = None
+        for pk, number, description, description_delta in rows:
+            if description_delta is not None:
+                if successor is None:
+                    # Newest revision should never be stored as delta
+                    return compacted
+                description = apply_delta(successor, description_delta)
+            elif successor is not None and number % interval:
+                delta = make_delta(successor, description)
+                if len(delta) < len(description):
+                    TaskRevision.objects.filter(pk=pk)\
+                        .update(description='', description_delta=delta)
+                    compacted += 1
+            successor = description
+        return compacted
+
+    def _get_mail_cache_key(self, part, *args):
+        """
+        Returns cache key of rendered mail's ``part`` for current revision.
+        """
+        bits = ['projector:task-mail', part, self.pk, self.revision]
+        bits.extend(args)
+        return ':'.join(str(bit) for bit in bits)
+
+    def get_long_summary(self):
+        """
+        Returns subject of email messages about the task. It is cached per
+        task revision.
+        """
+        key = self._get_mail_cache_key('summary')
+        result = cache.get(key)
+        if result is None:
+            raw = self.project.config.task_email_summary_format
+            tmpl = string.Template(raw)
+            result = tmpl.safe_substitute(project=self.project.name,
+                id=self.id, summary=self.summary)
+            cache.set(key, result, TASK_MAIL_CACHE_TIMEOUT)
+        return result
+
+    def get_long_content(self, since_revision=None):
+        """
+        Returns content of the task, suitable as email message's body. If
+        ``since_revision`` is given and lower than current revision, changes
+        and comments of all revisions since that one are listed, too (digest
+        of edits made within notification window).
+
+        Rendered content is cached per task revision.
+        """
+        key = self._get_mail_cache_key('content', since_revision)
+        result = cache.get(key)
+        if result is None:
+            revisions = []
+            if since_revision is not None and since_revision < self.revision:
+                revisions = self.taskrevision_set\
+                    .filter(revision__gte=since_revision)\
+                    .select_related('author')\
+                    .order_by('revision')
+            task_url = 'http://%s%s' % (Site.objects.get_current().domain,
+                self.get_absolute_url())
+            result = render_to_string('projector/project/task/mail.html', {
+                'task': self,
+                'task_url': task_url,
+                'revisions': revisions,
+            })
+            cache.set(key, result, TASK_MAIL_CACHE_TIMEOUT)
         return result
 
     def current_revision(self):
@@ -1528,41 +2053,118 @@ class Task(AbstractTask, Watchable):
         else:
             return self.taskrevision_set.get(revision=self.revision)
 
-    def notify(self, recipient_list=None):
+    def get_recipients(self):
         """
-        Notifies about task's status. If ``recipient_list`` is None, would
-        send a note to everyone who watch this task.
+        Returns queryset of users who should be notified about the task -
+        watchers and, if ``always_mail_members`` is set at project's
+        :model:`Config` (or :setting:`PROJECTOR_ALWAYS_SEND_MAILS_TO_MEMBERS`
+        is ``True``), all members of the project.
+        """
+        q = self.get_watchers_q()
+        if get_config_value('ALWAYS_SEND_MAILS_TO_MEMBERS') or \
+                self.project.config.always_mail_members:
+            q |= self.project.get_members_q()
+        return User.objects.filter(q)
+
+    def filter_recipients(self, recipient_list):
+        """
+        Returns given ``recipient_list`` limited to users allowed to be
+        notified about the task - for private projects only members and
+        author are allowed.
         """
-        if recipient_list is None:
-            recipient_list = self.get_watchers()
         if self.project.is_private():
             if isinstance(recipient_list, QuerySet):
                 recipient_list = recipient_list.filter(
-                    Q(membership__project=self.project) |
-                    Q(project=self.project) |
-                    #Q(is_superuser=True) |
-                    Q(groups__team__project=self.project))
+                    self.project.get_members_q())
             else:
                 raise TypeError("Currently only QuerySet instances are "
                     "allowed as recipient_list parameter for private "
                     "projects")
+        return recipient_list
+
+    def notify(self, recipient_list=None, since_revision=None,
+            connection=None):
+        """
+        Notifies about task's status. If ``recipient_list`` is None, would
+        send a note to users returned by ``get_recipients`` - those
+        subscribed to digests (see :model:`DigestSubscription`) get
+        notification queued instead. ``since_revision`` is passed to
+        ``get_long_content``.
+
+        Each recipient gets separate message (addresses are not disclosed to
+        other watchers) but all of them are sent through one ``connection``
+        (opened if not given).
+
+        :returns: number of sent messages
+        """
+        if recipient_list is None:
+            recipient_list = self.filter_recipients(self.get_recipients())
+            subscribers = TaskNotification.objects.queue(self, recipient_list,
+                since_revision)
+            if subscribers:
+                recipient_list = recipient_list.exclude(pk__in=subscribers)
+        else:
+            recipient_list = self.filter_recipients(recipient_list)
         if isinstance(recipient_list, QuerySet):
-            recipient_list = recipient_list.values_list('email', flat=True)
-        # Be sure not to double recipient
-        recipient_list=set(recipient_list)
-        mail_info = {
-            'subject': self.get_long_summary(),
-            'message': self.get_long_content(),
-            'from_email': settings.DEFAULT_FROM_EMAIL,
-            'recipient_list': [addr for addr in recipient_list],
-        }
-        send_mail(**mail_info)
+            recipient_list = list(recipient_list\
+                .exclude(email='')\
+                .order_by('email')\
+                .values_list('email', flat=True)\
+                .distinct())
+        else:
+            # Be sure not to double recipient
+            recipient_list = sorted(set(recipient_list))
+        if not recipient_list:
+            return 0
+        subject = self.get_long_summary()
+        body = self.get_long_content(since_revision)
+        messages = [EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL,
+            [address]) for address in recipient_list]
+        if connection is None:
+            connection = get_connection()
+        return connection.send_messages(messages)
+
+
+class ChangesField(models.TextField):
+    """
+    Stores result of ``Task.get_changes`` serialized as JSON list of
+    ``[field, current, previous]`` items.
+    """
+    __metaclass__ = models.SubfieldBase
+
+    def to_python(self, value):
+        if value is None or isinstance(value, dict):
+            return value
+        changes = SortedDict()
+        for name, current, previous in simplejson.loads(value):
+            changes[name] = (current, previous)
+        return changes
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return simplejson.dumps([[name, current, previous]
+            for name, (current, previous) in value.items()])
 
+try:
+    from south.modelsinspector import add_introspection_rules
+    add_introspection_rules([], ["^projector\.models\.ChangesField"])
+except ImportError:
+    pass
 
 class TaskRevision(AbstractTask):
+    """
+    Historical state of the :model:`Task`. Newest revision of each task and
+    snapshots keep full ``description`` - others have it empty and store
+    ``description_delta`` against their successor instead.
+    """
     task = models.ForeignKey(Task)
     comment = models.TextField(_('comment'), max_length=3000,
         null=True, blank=True)
+    description_delta = models.TextField(_('description delta'), null=True,
+        blank=True, editable=False)
+    changes = ChangesField(_('changes'), null=True, blank=True,
+        editable=False)
 
     class Meta:
         ordering = ('task', 'revision',)
@@ -1572,6 +2174,126 @@ class TaskRevision(AbstractTask):
         return "#%d %s: Revision %d" % (self.task.id, self.task.summary,
             self.revision)
 
+    def is_snapshot(self):
+        return self.description_delta is None
+
+    def get_description(self):
+        """
+        Returns full description of this revision. If it is stored as delta,
+        successors up to the nearest snapshot are fetched (with one query) in
+        order to restore it.
+        """
+        if self.is_snapshot():
+            return self.description
+        revisions = [self] + self.get_successors_to_snapshot()
+        TaskRevision.restore_descriptions(revisions)
+        return self.description
+
+    def get_successors_to_snapshot(self):
+        """
+        Returns list of revisions newer than this one, up to (and including)
+        the nearest snapshot, ordered by revision number. Only fields needed
+        to restore description are fetched.
+        """
+        successors = list(TaskRevision.objects\
+            .filter(task__pk=self.task_id, revision__gt=self.revision)\
+            .order_by('revision')\
+            .only('revision', 'description', 'description_delta'))
+        for i, successor in enumerate(successors):
+            if successor.is_snapshot():
+                return successors[:i+1]
+        return successors
+
+    @staticmethod
+    def restore_descriptions(revisions):
+        """
+        Restores full descriptions of the given revisions, which should be
+        a list of revisions of one task ordered by revision number. Revisions
+        stored as deltas which cannot be restored (newer revisions are not
+        present at the list) are left untouched.
+        """
+        description = None
+        for revision in reversed(revisions):
+            if revision.is_snapshot():
+                description = revision.description
+            elif description is not None:
+                description = apply_delta(description,
+                    revision.description_delta)
+                revision.description = description
+        return revisions
+
+class TaskSearchTerm(models.Model):
+    """
+    Entry of the inverted index used by task search: weighted occurrence of
+    the ``term`` at summary and description (or at revision comments) of the
+    ``task``. Entries are maintained by signal listeners - use
+    ``rebuild_task_index`` command to recreate them.
+    """
+    SUMMARY_WEIGHT = 4
+    DESCRIPTION_WEIGHT = 1
+    COMMENT_WEIGHT = 1
+
+    task = models.ForeignKey(Task, related_name='search_terms')
+    term = models.CharField(_('term'), max_length=50, db_index=True)
+    weight = models.PositiveIntegerField(_('weight'))
+    is_comment = models.BooleanField(_('is comment'), default=False)
+
+    objects = TaskSearchTermManager()
+
+    class Meta:
+        verbose_name = _('task search term')
+        verbose_name_plural = _('task search terms')
+
+    def __unicode__(self):
+        return u'%s (%d)' % (self.term, self.weight)
+
+class DigestFrequency(Choices):
+    """
+    Represents how often digest of task notifications is sent.
+    """
+    HOURLY = 1
+    DAILY = 2
+
+
+class DigestSubscription(models.Model):
+    """
+    User's choice to receive notifications about watched tasks as periodic
+    digest instead of separate message for each edit.
+    """
+    user = models.OneToOneField(User, verbose_name=_('user'),
+        related_name='digest_subscription')
+    frequency = models.IntegerField(_('frequency'),
+        choices=DigestFrequency.as_choices(), default=DigestFrequency.DAILY)
+
+    class Meta:
+        verbose_name = _('digest subscription')
+        verbose_name_plural = _('digest subscriptions')
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.user, self.get_frequency_display())
+
+
+class TaskNotification(models.Model):
+    """
+    Notification about the ``task`` (changed since ``revision``) waiting to
+    be sent to the ``user`` within digest. Pending notifications are sent by
+    :manager:`TaskNotificationManager` periodically.
+    """
+    user = models.ForeignKey(User, verbose_name=_('user'))
+    task = models.ForeignKey(Task, verbose_name=_('task'))
+    revision = models.IntegerField(_('revision'))
+    created_at = models.DateTimeField(_('created at'),
+        default=datetime.datetime.now)
+
+    objects = TaskNotificationManager()
+
+    class Meta:
+        verbose_name = _('task notification')
+        verbose_name_plural = _('task notifications')
+
+    def __unicode__(self):
+        return u"%s: #%s@%s" % (self.user_id, self.task_id, self.revision)
+
 class UserProfile(RichUserProfile):
     """
     Base user profile class for ``django-projector``.
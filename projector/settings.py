@@ -98,6 +98,12 @@ FORK_EXTERNAL_MAP = getattr(settings,
 
 FROM_EMAIL_ADDRESS = settings.DEFAULT_FROM_EMAIL
 
+GIT_CLONE_PACK_CACHE = getattr(settings,
+    'PROJECTOR_GIT_CLONE_PACK_CACHE', True)
+
+GIT_DECODE_CHUNKED_INPUT = getattr(settings,
+    'PROJECTOR_GIT_DECODE_CHUNKED_INPUT', False)
+
 HG_PUSH_SSL = getattr(settings, 'PROJECTOR_HG_PUSH_SSL',
         getattr(vcs_settings, 'PUSH_SSL', False))
 
@@ -127,16 +133,41 @@ else:
 PROJECTS_HOMEDIR_GETTER = getattr(settings, 'PROJECTOR_PROJECTS_HOMEDIR_GETTER',
     'projector.utils.helpers.get_homedir')
 
+PERMISSIONS_CACHE_TIMEOUT = getattr(settings,
+    'PROJECTOR_PERMISSIONS_CACHE_TIMEOUT', 300)
+
+REPOSITORY_POOL_SIZE = getattr(settings,
+    'PROJECTOR_REPOSITORY_POOL_SIZE', 10)
+
 PRIVATE_ONLY = getattr(settings,
     'PROJECTOR_PRIVATE_ONLY', False)
 
 SEND_MAIL_ASYNCHRONOUSELY = getattr(settings,
     'PROJECTOR_SEND_MAIL_ASYNCHRONOUSELY', True)
 
+# Local memory and dummy backends are not shared between processes
+SHARED_CACHE = getattr(settings, 'PROJECTOR_SHARED_CACHE',
+    settings.CACHE_BACKEND.split(':', 1)[0] not in ('locmem', 'dummy'))
+
 TASK_EMAIL_SUBJECT_SUMMARY_FORMAT = getattr(settings,
     'PROJECTOR_TASK_EMAIL_SUBJECT_SUMMARY_FORMAT',
     "[$project] #$id: $summary")
 
+TASK_REVISIONS_PAGINATE_BY = getattr(settings,
+    'PROJECTOR_TASK_REVISIONS_PAGINATE_BY', 20)
+
+TASK_REVISION_SNAPSHOT_INTERVAL = getattr(settings,
+    'PROJECTOR_TASK_REVISION_SNAPSHOT_INTERVAL', 20)
+
+TASK_LIST_PAGINATE_BY = getattr(settings,
+    'PROJECTOR_TASK_LIST_PAGINATE_BY', 20)
+
+TASK_LIST_COUNT_LIMIT = getattr(settings,
+    'PROJECTOR_TASK_LIST_COUNT_LIMIT', 1000)
+
+TASK_NOTIFICATION_DELAY = getattr(settings,
+    'PROJECTOR_TASK_NOTIFICATION_DELAY', 60)
+
 # =================== #
 # Settings dictionary #
 # =================== #
@@ -153,15 +184,26 @@ PROJECTOR = {
     'FORK_EXTERNAL_ENABLED': FORK_EXTERNAL_ENABLED,
     'FORK_EXTERNAL_MAP': FORK_EXTERNAL_MAP,
     'FROM_EMAIL_ADDRESS': settings.DEFAULT_FROM_EMAIL,
+    'GIT_CLONE_PACK_CACHE': GIT_CLONE_PACK_CACHE,
+    'GIT_DECODE_CHUNKED_INPUT': GIT_DECODE_CHUNKED_INPUT,
     'HG_PUSH_SSL': HG_PUSH_SSL,
     'HIDDEN_EMAIL_SUBSTITUTION': HIDDEN_EMAIL_SUBSTITUTION,
     'MAX_PROJECTS_PER_USER': MAX_PROJECTS_PER_USER,
     'MILESTONE_DEADLINE_DELTA': MILESTONE_DEADLINE_DELTA,
     'MILIS_BETWEEN_PROJECT_CREATION': MILIS_BETWEEN_PROJECT_CREATION,
     'PRIVATE_ONLY': PRIVATE_ONLY,
+    'REPOSITORY_POOL_SIZE': REPOSITORY_POOL_SIZE,
     'PROJECTS_ROOT_DIR': PROJECTS_ROOT_DIR,
     'PROJECTS_HOMEDIR_GETTER': PROJECTS_HOMEDIR_GETTER,
+    'PERMISSIONS_CACHE_TIMEOUT': PERMISSIONS_CACHE_TIMEOUT,
+    'SEND_MAIL_ASYNCHRONOUSELY': SEND_MAIL_ASYNCHRONOUSELY,
+    'SHARED_CACHE': SHARED_CACHE,
     'TASK_EMAIL_SUBJECT_SUMMARY_FORMAT': TASK_EMAIL_SUBJECT_SUMMARY_FORMAT,
+    'TASK_REVISIONS_PAGINATE_BY': TASK_REVISIONS_PAGINATE_BY,
+    'TASK_REVISION_SNAPSHOT_INTERVAL': TASK_REVISION_SNAPSHOT_INTERVAL,
+    'TASK_LIST_PAGINATE_BY': TASK_LIST_PAGINATE_BY,
+    'TASK_LIST_COUNT_LIMIT': TASK_LIST_COUNT_LIMIT,
+    'TASK_NOTIFICATION_DELAY': TASK_NOTIFICATION_DELAY,
 }
 
 def get_config_value(key):
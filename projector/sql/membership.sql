@@ -0,0 +1,3 @@
+-- Covers memberships of given users read when their project visibility is
+-- refreshed (see ProjectVisibilityManager.get_expected)
+CREATE INDEX projector_membership_member_project ON projector_membership (member_id, project_id);
@@ -0,0 +1,2 @@
+-- Public projects are listed ordered by name (see ProjectManager.for_user)
+CREATE INDEX projector_project_public_name ON projector_project (public, name);
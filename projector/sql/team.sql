@@ -0,0 +1,3 @@
+-- Covers teams of groups of given users read when their project visibility
+-- is refreshed (see ProjectVisibilityManager.get_expected)
+CREATE INDEX projector_team_group_project ON projector_team (group_id, project_id);
@@ -2,14 +2,142 @@ import logging
 import StringIO
 import traceback
 
-from celery.decorators import task
+from datetime import timedelta
 
+from celery.decorators import periodic_task, task
+
+from django.core.cache import cache
 from django.utils.translation import ugettext as _
 
-from projector.models import Project, State
+from projector.models import DigestFrequency, Project, State, Task
+from projector.models import TaskNotification
 from projector.utils import str2obj
 from projector.settings import get_config_value
 
+# Pending notification marker outlives the countdown, so it expires even if
+# scheduled job is lost
+TASK_NOTIFICATION_KEY_GRACE = 60 * 10
+
+def get_task_notification_key(task_pk):
+    return 'projector:task-notification:%s' % task_pk
+
+def schedule_task_notification(task):
+    """
+    Notifies watchers of the ``task`` about its last revision. If
+    :setting:`PROJECTOR_SEND_MAIL_ASYNCHRONOUSELY` is ``True``, notification
+    is queued as :func:`send_task_notification` job.
+
+    If :setting:`PROJECTOR_SHARED_CACHE` is ``True``, job is delayed by
+    :setting:`PROJECTOR_TASK_NOTIFICATION_DELAY` seconds and pending job is
+    marked at the cache - if job for the task is already pending, nothing is
+    queued and all revisions created within the window are sent as one
+    digest message. Otherwise the marker would not be seen by other
+    processes, so each revision is queued immediately.
+
+    :param task: instance of :model:`Task` with revision already created
+    """
+    if not get_config_value('SEND_MAIL_ASYNCHRONOUSELY'):
+        return task.notify()
+    if not get_config_value('SHARED_CACHE'):
+        send_task_notification.delay(task.pk, task.revision)
+        return
+    delay = get_config_value('TASK_NOTIFICATION_DELAY')
+    if cache.add(get_task_notification_key(task.pk), task.revision,
+            delay + TASK_NOTIFICATION_KEY_GRACE):
+        send_task_notification.apply_async(args=[task.pk, task.revision],
+            countdown=delay)
+
+@task(ignore_result=True)
+def send_task_notification(task_pk, since_revision=None):
+    """
+    Sends digest of task's revisions created since the notification has been
+    scheduled (see :func:`schedule_task_notification`).
+
+    :param task_pk: primary key of :model:`Task`
+    :param since_revision: first revision which is not notified yet; if not
+      given, only the last revision is notified
+    """
+    # Revisions created from now on are notified by another job
+    cache.delete(get_task_notification_key(task_pk))
+    try:
+        task = Task.objects.select_related('project__author', 'author',
+            'status', 'priority', 'component').get(pk=task_pk)
+    except Task.DoesNotExist:
+        logging.info("Task %s removed before notification has been sent"
+            % task_pk)
+        return 0
+    return task.notify(since_revision=since_revision)
+
+@periodic_task(run_every=timedelta(hours=1), ignore_result=True)
+def send_hourly_digests():
+    """
+    Sends digests of task notifications to users subscribed hourly.
+    """
+    return TaskNotification.objects.flush(DigestFrequency.HOURLY)
+
+@periodic_task(run_every=timedelta(days=1), ignore_result=True)
+def send_daily_digests():
+    """
+    Sends digests of task notifications to users subscribed daily.
+    """
+    return TaskNotification.objects.flush(DigestFrequency.DAILY)
+
+@task(ignore_result=True)
+def update_repository_size(project_pk):
+    """
+    Updates stored size of the project's repository (after push).
+
+    :param project_pk: primary key of :model:`Project`
+    """
+    try:
+        project = Project.objects.select_related('repository')\
+            .get(pk=project_pk)
+    except Project.DoesNotExist:
+        return None
+    return project.update_repository_size()
+
+@task(ignore_result=True)
+def build_clone_pack(project_pk):
+    """
+    Rebuilds clone pack of the project's git repository (after push) if
+    :setting:`PROJECTOR_GIT_CLONE_PACK_CACHE` is ``True``.
+
+    :param project_pk: primary key of :model:`Project`
+    """
+    if not get_config_value('GIT_CLONE_PACK_CACHE'):
+        return None
+    try:
+        project = Project.objects.select_related('repository')\
+            .get(pk=project_pk)
+    except Project.DoesNotExist:
+        return None
+    if project.repository is None or project.repository.alias != 'git':
+        return None
+    from projector.contrib.git.clonecache import ClonePackCache
+    return ClonePackCache(project.repository._repo._repo).build()
+
+@periodic_task(run_every=timedelta(days=1), ignore_result=True)
+def reconcile_repository_sizes():
+    """
+    Corrects stored sizes of all repositories which drifted from the actual
+    ones (i.e. repositories changed without push).
+
+    :returns: number of corrected projects
+    """
+    corrected = 0
+    projects = Project.objects\
+        .filter(repository__isnull=False)\
+        .select_related('repository')
+    for project in projects.iterator():
+        stored = project.repository_size
+        try:
+            if project.update_repository_size() != stored:
+                corrected += 1
+        except (IOError, OSError), err:
+            logging.error("Cannot compute size of repository of project "
+                "%s: %s" % (project.pk, err))
+    return corrected
+
 @task
 def project_create_repository(instance, vcs_alias=None):
     if get_config_value('CREATE_REPOSITORIES'):
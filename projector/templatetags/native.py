@@ -1,7 +1,8 @@
 from django.template.loader import render_to_string
 from django.http import Http404
 
-from projector.models import Membership, Watchable
+from projector.core.permissions import get_permission_resolver
+from projector.models import Watchable
 from vcs.utils.annotate import annotate_highlight
 from vcs.exceptions import VCSError
 from native_tags.decorators import function, filter
@@ -17,10 +18,7 @@ def get_project_permissions(project=None, for_bit=None, user=None):
        {% get_project_permissions project for request.user as "user_permissions" %}
     """
     assert project and for_bit == "for" and user
-    try:
-        return Membership.objects.get(project=project, member=user).all_perms
-    except Membership.DoesNotExist:
-        return []
+    return get_permission_resolver(user).get_perms(project)
 get_project_permissions.function = True
 
 def put_username_into_url(value, user):
@@ -7,13 +7,21 @@ from django.utils.html import escape
 from django import template
 from django.utils.translation import ugettext as _
 
-from projector.models import Task
 from projector.models import get_user_from_string
 from projector.settings import get_config_value
 from projector.utils.email import EMAIL_RE
 
 register = template.Library()
 
+# Skips numeric character references (escaped messages contain ``&#39;``)
+TASK_REFERENCE_RE = re.compile(r'(?<!&)#(\d+)')
+
+def get_task_references(message):
+    """
+    Returns set of task ids referenced (as ``#123``) at the given message.
+    """
+    return set(int(id) for id in TASK_REFERENCE_RE.findall(message or ''))
+
 def restructuredtext(value):
     try:
         from docutils.core import publish_parts
@@ -41,6 +49,22 @@ def hide_email(value, sub=None):
     value = EMAIL_RE.sub(sub, value)
     return value
 
+@register.simple_tag
+def prefetch_task_references(changesets, project):
+    """
+    Fetches (with one query) all tasks referenced at messages of the given
+    changesets, so ``changeset_message`` filter wouldn't need to query for
+    them one by one. Should be used before changesets are rendered::
+
+        {% prefetch_task_references changesets project %}
+
+    """
+    ids = set()
+    for changeset in changesets:
+        ids.update(get_task_references(changeset.message))
+    project.get_tasks_by_ids(ids)
+    return ''
+
 @register.filter
 def changeset_message(value, project=None, path=None):
     if (project is None and path is None) or (project and path):
@@ -49,23 +73,22 @@ def changeset_message(value, project=None, path=None):
             "You have to exactly one of them"
     value = escape(value)
     if project:
+        tasks = project.get_tasks_by_ids(get_task_references(value))
         def repl(m):
             id = int(m.group(1))
-            try:
-                task = project.get_task(id)
-                message = _("Summary") + ": %s" % task.summary + "\n" + \
-                    _("Status") + ": %s" % task.status
-                archon = '<a href="%s" class="show-tipsy" title="%s">#%d</a>'\
-                    % (task.get_absolute_url(), escape(message), id)
-                if task.status.is_resolved:
-                    archon = '<strike>' + archon + '</strike>'
-            except Task.DoesNotExist:
+            task = tasks[id]
+            if task is None:
                 notask_message = _("There is no such task for this project")
-                archon = '<span class="show-tipsy" title="%s">#%d</span>'\
+                return '<span class="show-tipsy" title="%s">#%d</span>'\
                     % (notask_message, id)
+            message = _("Summary") + ": %s" % task.summary + "\n" + \
+                _("Status") + ": %s" % task.status
+            archon = '<a href="%s" class="show-tipsy" title="%s">#%d</a>'\
+                % (task.get_absolute_url(), escape(message), id)
+            if task.status.is_resolved:
+                archon = '<strike>' + archon + '</strike>'
             return archon
-        #import pdb; pdb.set_trace()
-        value = re.sub(r'#(\d+)', repl, value)
+        value = TASK_REFERENCE_RE.sub(repl, value)
     if path:
         raise NotImplementedError
     return mark_safe(value)
@@ -5,6 +5,7 @@ from test_concurrency import *
 from test_controllers import *
 from test_emails import *
 from test_fork import *
+from test_git import *
 from test_helpers import *
 from test_members import *
 from test_milestone import *
@@ -12,6 +13,7 @@ from test_permissions import *
 from test_settings import *
 from test_statustransition import *
 from test_status import *
+from test_tasks import *
 from test_teams import *
 from test_templatetags import *
 from test_user2team_conversion import *
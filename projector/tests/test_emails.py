@@ -1,10 +1,40 @@
+import smtplib
+
 from django.core import mail
+from django.core.cache import cache
 from django.contrib.auth.models import User, Group
 from django.test import TestCase
 from django.test.client import Client
 from django.core.urlresolvers import reverse
 
-from projector.models import Task, Team, Membership
+from projector import settings as projector_settings
+from projector.models import DigestFrequency, DigestSubscription
+from projector.models import Project, Task, TaskNotification, Team
+from projector.models import Membership
+from projector.tasks import get_task_notification_key, send_task_notification
+from projector.tasks import schedule_task_notification
+
+class FailingConnection(object):
+    """
+    Email connection which fails after ``fail_after`` messages are sent.
+    """
+
+    def __init__(self, fail_after):
+        self.fail_after = fail_after
+        self.sent = []
+
+    def open(self):
+        return False
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        if len(self.sent) + len(messages) > self.fail_after:
+            raise smtplib.SMTPException("Connection lost")
+        self.sent.extend(messages)
+        return len(messages)
+
 
 class EmailTest(TestCase):
 
@@ -12,6 +42,10 @@ class EmailTest(TestCase):
 
     def setUp(self):
         self.client = Client()
+        self._shared_cache = projector_settings.SHARED_CACHE
+
+    def tearDown(self):
+        projector_settings.SHARED_CACHE = self._shared_cache
 
     def _create_task(self, user, project, summary='Task summary',
         description='Example description', watch_changes=True):
@@ -41,6 +75,17 @@ class EmailTest(TestCase):
         self.assertEqual(response.status_code, 200)
         return user.task_set.filter(project=project).order_by('-created_at')[0]
 
+    def _get_recipients(self, messages):
+        """
+        Returns set of addresses given messages were sent to. Each message
+        should be sent to one recipient only.
+        """
+        recipients = set()
+        for message in messages:
+            self.assertEquals(len(message.recipients()), 1)
+            recipients.update(message.recipients())
+        return recipients
+
     def test_tasks_notification(self):
         # needs project to be created first
         jack = User.objects.get(username='jack')
@@ -57,29 +102,29 @@ class EmailTest(TestCase):
         self.client.login(username='joe', password='joe')
         task.watch(joe)
 
-        # After joe started to watch task, calling ``notify`` should send one
-        # mail with both jack and joe in recipient list
+        # After joe started to watch task, calling ``notify`` should send
+        # separate mails to both jack and joe
         task.notify()
-        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(len(mail.outbox), 3)
         self.assertEquals(
             set([jack.email, joe.email]),
-            set(mail.outbox[1].recipients())
+            self._get_recipients(mail.outbox[1:])
         )
 
         # If we set recipient list arbitrary we expect only those recipients
         # would receive the message
         recipient_list = [joe.email]
         task.notify(recipient_list=recipient_list)
-        self.assertEquals(len(mail.outbox), 3)
-        self.assertEquals(recipient_list, mail.outbox[2].recipients())
+        self.assertEquals(len(mail.outbox), 4)
+        self.assertEquals(recipient_list, mail.outbox[3].recipients())
 
         # If project is private we need to ensure only members and author/owner
         # would receive the message
         task.project.public = False
         task.project.save()
         task.notify()
-        self.assertEquals(len(mail.outbox), 4)
-        self.assertEquals([jack.email], mail.outbox[3].recipients())
+        self.assertEquals(len(mail.outbox), 5)
+        self.assertEquals([jack.email], mail.outbox[4].recipients())
 
         # But if joe would join Team associated with task's project then he
         # could get the message
@@ -87,19 +132,189 @@ class EmailTest(TestCase):
         joe.groups.add(group)
         Team.objects.create(group=group, project=task.project)
         task.notify()
-        self.assertEquals(len(mail.outbox), 5)
+        self.assertEquals(len(mail.outbox), 7)
         self.assertEquals(
             set([jack.email, joe.email]),
-            set(mail.outbox[4].recipients()),
+            self._get_recipients(mail.outbox[5:]),
         )
 
         # Membership would be enough, too
         joe.groups.remove(group)
         Membership.objects.create(project=task.project, member=joe)
         task.notify()
-        self.assertEquals(len(mail.outbox), 6)
+        self.assertEquals(len(mail.outbox), 9)
         self.assertEquals(
             set([jack.email, joe.email]),
-            set(mail.outbox[5].recipients()),
+            self._get_recipients(mail.outbox[7:]),
         )
 
+    def _edit_task(self, task, user, comments):
+        for comment in comments:
+            task.comment = comment
+            task.editor = user
+            task.editor_ip = ''
+            task.save()
+            task.create_revision()
+            schedule_task_notification(task)
+
+    def test_notifications_coalescing(self):
+        jack = User.objects.get(username='jack')
+        self.client.login(username='jack', password='jack')
+        project = jack.project_set.all()[0]
+        task = self._create_task(user=jack, project=project)
+        self.assertEquals(len(mail.outbox), 1)
+
+        projector_settings.SHARED_CACHE = True
+        # Notification job is pending - edits made meanwhile should not
+        # schedule another one
+        since_revision = task.revision + 1
+        key = get_task_notification_key(task.pk)
+        cache.set(key, since_revision)
+        self._edit_task(task, jack, (u'First comment', u'Second comment'))
+        self.assertEquals(len(mail.outbox), 1)
+
+        # Job sends one digest with both edits
+        self.assertEquals(send_task_notification(task.pk, since_revision), 1)
+        self.assertEquals(len(mail.outbox), 2)
+        self.assertTrue(u'First comment' in mail.outbox[1].body)
+        self.assertTrue(u'Second comment' in mail.outbox[1].body)
+        self.assertEquals(cache.get(key), None)
+
+    def test_notifications_separate_cache(self):
+        jack = User.objects.get(username='jack')
+        self.client.login(username='jack', password='jack')
+        project = jack.project_set.all()[0]
+        task = self._create_task(user=jack, project=project)
+
+        projector_settings.SHARED_CACHE = True
+        since_revision = task.revision + 1
+        cache.set(get_task_notification_key(task.pk), since_revision)
+        self._edit_task(task, jack, (u'First comment', u'Second comment'))
+        # Worker doesn't see the marker set by web process
+        cache.clear()
+        self.assertEquals(send_task_notification(task.pk, since_revision), 1)
+        self.assertEquals(len(mail.outbox), 2)
+        self.assertTrue(u'First comment' in mail.outbox[1].body)
+        self.assertTrue(u'Second comment' in mail.outbox[1].body)
+
+    def test_notifications_not_shared_cache(self):
+        jack = User.objects.get(username='jack')
+        self.client.login(username='jack', password='jack')
+        project = jack.project_set.all()[0]
+        task = self._create_task(user=jack, project=project)
+
+        # Marker is not used, each revision is notified
+        projector_settings.SHARED_CACHE = False
+        cache.set(get_task_notification_key(task.pk), task.revision)
+        self._edit_task(task, jack, (u'First comment', u'Second comment'))
+        self.assertEquals(len(mail.outbox), 3)
+        self.assertTrue(u'First comment' in mail.outbox[1].body)
+        self.assertFalse(u'Second comment' in mail.outbox[1].body)
+        self.assertTrue(u'Second comment' in mail.outbox[2].body)
+
+    def test_digests(self):
+        jack = User.objects.get(username='jack')
+        joe = User.objects.get(username='joe')
+        self.client.login(username='jack', password='jack')
+        project = jack.project_set.all()[0]
+        task = self._create_task(user=jack, project=project)
+        task.watch(joe)
+        DigestSubscription.objects.create(user=joe,
+            frequency=DigestFrequency.HOURLY)
+
+        # Subscribed watcher's notifications are queued
+        for comment in (u'First comment', u'Second comment'):
+            task.comment = comment
+            task.editor = jack
+            task.editor_ip = ''
+            task.save()
+            task.create_revision()
+            self.assertEquals(task.notify(), 1)
+        self.assertEquals(len(mail.outbox), 3)
+        self.assertEquals(set([jack.email]),
+            self._get_recipients(mail.outbox[1:]))
+        self.assertEquals(TaskNotification.objects.filter(user=joe).count(), 2)
+
+        # Only hourly subscribers are notified
+        self.assertEquals(TaskNotification.objects.flush(
+            DigestFrequency.DAILY), 0)
+        self.assertEquals(TaskNotification.objects.flush(
+            DigestFrequency.HOURLY), 1)
+        self.assertEquals(len(mail.outbox), 4)
+        self.assertEquals([joe.email], mail.outbox[3].recipients())
+        self.assertTrue(u'First comment' in mail.outbox[3].body)
+        self.assertTrue(u'Second comment' in mail.outbox[3].body)
+        self.assertEquals(TaskNotification.objects.count(), 0)
+
+    def _queue_digests(self, project, users):
+        jack = User.objects.get(username='jack')
+        self.client.login(username='jack', password='jack')
+        task = self._create_task(user=jack, project=project)
+        for user in users:
+            task.watch(user)
+            DigestSubscription.objects.create(user=user,
+                frequency=DigestFrequency.HOURLY)
+        task = Task.objects.get(pk=task.pk)
+        task.notify()
+        return task
+
+    def test_digests_send_failure(self):
+        jack = User.objects.get(username='jack')
+        joe = User.objects.get(username='joe')
+        project = jack.project_set.all()[0]
+        self._queue_digests(project, [jack, joe])
+        self.assertEquals(TaskNotification.objects.count(), 2)
+
+        connection = FailingConnection(fail_after=1)
+        self.assertRaises(smtplib.SMTPException,
+            TaskNotification.objects.flush, DigestFrequency.HOURLY,
+            connection=connection)
+        # Notifications of the user whose digest has been sent are removed
+        self.assertEquals(len(connection.sent), 1)
+        sent_to = User.objects.get(email=connection.sent[0].recipients()[0])
+        self.assertEquals(list(TaskNotification.objects\
+            .values_list('user', flat=True)),
+            [user.pk for user in (jack, joe) if user != sent_to])
+
+        self.assertEquals(TaskNotification.objects.flush(
+            DigestFrequency.HOURLY), 1)
+        self.assertEquals(TaskNotification.objects.count(), 0)
+
+    def test_digests_private_project(self):
+        jack = User.objects.get(username='jack')
+        joe = User.objects.get(username='joe')
+        project = jack.project_set.all()[0]
+        Project.objects.filter(pk=project.pk).update(public=False)
+        membership = Membership.objects.create(project=project, member=joe)
+        self._queue_digests(Project.objects.get(pk=project.pk), [joe])
+        self.assertEquals(TaskNotification.objects.filter(user=joe).count(), 1)
+
+        # Joe is not allowed to be notified after he is removed from project
+        membership.delete()
+        outbox = len(mail.outbox)
+        self.assertEquals(TaskNotification.objects.flush(
+            DigestFrequency.HOURLY), 0)
+        self.assertEquals(len(mail.outbox), outbox)
+        self.assertEquals(TaskNotification.objects.count(), 0)
+
+    def test_always_mail_members(self):
+        jack = User.objects.get(username='jack')
+        joe = User.objects.get(username='joe')
+        self.client.login(username='jack', password='jack')
+        project = jack.project_set.all()[0]
+        task = self._create_task(user=jack, project=project)
+        Membership.objects.create(project=project, member=joe)
+
+        # Joe is a member but doesn't watch the task
+        task.notify()
+        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals([jack.email], mail.outbox[1].recipients())
+
+        config = project.config
+        config.always_mail_members = True
+        config.save()
+        task = Task.objects.get(pk=task.pk)
+        task.notify()
+        self.assertEquals(len(mail.outbox), 4)
+        self.assertEquals(set([jack.email, joe.email]),
+            self._get_recipients(mail.outbox[2:]))
@@ -0,0 +1,434 @@
+import glob
+import os
+import resource
+import shutil
+import StringIO
+import struct
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpRequest
+from django.test import TestCase
+from django.utils import simplejson
+
+from projector import settings as projector_settings
+from projector.contrib.git.clonecache import ClonePackCache
+from projector.contrib.git.githttp import GitWebServer
+from projector.contrib.git.utils import ChunkedInput, get_wsgi_environ
+from projector.contrib.git.utils import get_wsgi_response
+from projector.models import Project
+from projector.tasks import reconcile_repository_sizes
+
+from dulwich.objects import Blob, Commit, Tree
+from dulwich.pack import write_pack_data
+from dulwich.repo import Repo
+
+from vcs.web.simplevcs.signals import post_push
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_pack_app(size):
+    """
+    Returns WSGI application writing ``size`` bytes of distinct chunks, as
+    upload-pack handler writes pack data of a large clone.
+    """
+    def app(environ, start_response):
+        write = start_response('200 OK', [
+            ('Content-Type', 'application/x-git-upload-pack-result')])
+        for i in xrange(size / CHUNK_SIZE):
+            write(('%08d' % i) * (CHUNK_SIZE / 8))
+        return []
+    return app
+
+def get_peak_rss():
+    """
+    Returns peak resident set size of the process in megabytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+# Streams pack of given size and prints number of sent bytes and growth of
+# the peak RSS (in megabytes)
+PEAK_RSS_SCRIPT = """
+import sys
+from django.http import HttpRequest
+from projector.contrib.git.utils import get_wsgi_response
+from projector.tests.test_git import get_pack_app, get_peak_rss
+
+size = int(sys.argv[1])
+request = HttpRequest()
+request.META = {'REQUEST_METHOD': 'POST'}
+peak = get_peak_rss()
+response = get_wsgi_response(get_pack_app(size), request, stream=True)
+sent = 0
+for chunk in response:
+    sent += len(chunk)
+print sent, get_peak_rss() - peak
+"""
+
+
+class GitStreamingTest(TestCase):
+
+    def setUp(self):
+        self.request = HttpRequest()
+        self.request.META = {'REQUEST_METHOD': 'POST'}
+
+    def test_streamed_content(self):
+        finished = []
+        response = get_wsgi_response(get_pack_app(CHUNK_SIZE * 3),
+            self.request, stream=True, on_finish=lambda: finished.append(1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+            'application/x-git-upload-pack-result')
+        self.assertEqual(finished, [])
+        content = ''.join(response)
+        self.assertEqual(len(content), CHUNK_SIZE * 3)
+        self.assertTrue(content.startswith('00000000'))
+        self.assertEqual(finished, [1])
+
+    def test_error_before_response(self):
+        def app(environ, start_response):
+            raise ValueError("Broken repository")
+        self.assertRaises(ValueError, get_wsgi_response, app, self.request,
+            stream=True)
+
+    def test_large_clone_peak_rss(self):
+        # Peak RSS never goes down, so it is measured by fresh process, not
+        # affected by tests run before
+        size = 256 * 1024 * 1024
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        process = subprocess.Popen([sys.executable, '-c', PEAK_RSS_SCRIPT,
+            str(size)], env=env, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        sent, growth = output.split()
+        self.assertEqual(int(sent), size)
+        # Buffered pack would raise the peak by its whole size
+        self.assertTrue(float(growth) < 64,
+            "Peak RSS grew by %s MB while streaming %d MB pack" % (
+                growth, size / 1024 / 1024))
+
+
+class ChunkedInputTest(TestCase):
+
+    body = '5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n'
+
+    def setUp(self):
+        self._decode = projector_settings.GIT_DECODE_CHUNKED_INPUT
+
+    def tearDown(self):
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = self._decode
+
+    def test_read_all(self):
+        stream = ChunkedInput(StringIO.StringIO(self.body))
+        self.assertEqual(stream.read(), 'hello world')
+        self.assertEqual(stream.read(), '')
+
+    def test_read_parts(self):
+        stream = ChunkedInput(StringIO.StringIO(self.body))
+        parts = [stream.read(3) for i in xrange(5)]
+        self.assertEqual(parts, ['hel', 'lo ', 'wor', 'ld', ''])
+
+    def test_truncated_body(self):
+        stream = ChunkedInput(StringIO.StringIO('5\r\nhel'))
+        self.assertRaises(IOError, stream.read)
+
+    def test_environ(self):
+        request = HttpRequest()
+        request.META = {
+            'HTTP_TRANSFER_ENCODING': 'chunked',
+            'CONTENT_LENGTH': '',
+            'wsgi.input': StringIO.StringIO(self.body),
+        }
+        # Most servers decode the body
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = False
+        env = get_wsgi_environ(request)
+        self.assertFalse('CONTENT_LENGTH' in env)
+        self.assertTrue(env['wsgi.input'] is request.META['wsgi.input'])
+
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = True
+        env = get_wsgi_environ(request)
+        self.assertEqual(env['wsgi.input'].read(), 'hello world')
+
+        # Body already decoded by the server is passed as is
+        request.META['wsgi.input_terminated'] = True
+        env = get_wsgi_environ(request)
+        self.assertTrue(env['wsgi.input'] is request.META['wsgi.input'])
+
+
+class RepositorySizeTest(TestCase):
+
+    def setUp(self):
+        self.joe = User.objects.create(username='joe')
+        project = Project.objects.create_project(name='project',
+            author=self.joe)
+        self.project = Project.objects.get(pk=project.pk)
+
+    def _get_project(self):
+        return Project.objects.get(pk=self.project.pk)
+
+    def test_size_updated_on_push(self):
+        if self.project.repository is None:
+            # Repositories are not created
+            return
+        self.assertEqual(self.project.repository_size,
+            self.project.repository.info.size)
+        Project.objects.filter(pk=self.project.pk).update(repository_size=-1)
+        post_push.send(sender=None, repo_path=self.project.repository.path,
+            ip='', username=self.joe.username)
+        self.assertEqual(self._get_project().repository_size,
+            self.project.repository.info.size)
+
+    def test_reconcile(self):
+        if self.project.repository is None:
+            return
+        Project.objects.filter(pk=self.project.pk).update(repository_size=-1)
+        self.assertEqual(reconcile_repository_sizes(), 1)
+        self.assertEqual(reconcile_repository_sizes(), 0)
+        self.assertEqual(self._get_project().repository_size,
+            self.project.repository.info.size)
+
+
+class FakeRepo(object):
+
+    def __init__(self, path, refs):
+        self.path = path
+        self.refs = refs
+
+    def controldir(self):
+        return self.path
+
+    def get_refs(self):
+        return self.refs
+
+
+class ClonePackCacheTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.repo = FakeRepo(self.path, {
+            'HEAD': 'a' * 40,
+            'refs/heads/master': 'a' * 40,
+            'refs/heads/stable': 'b' * 40,
+        })
+        self.cache = ClonePackCache(self.repo)
+        pack_path = self.cache.get_pack_path(self.cache.get_tips())
+        self.cache._write(pack_path, lambda f: f.write('PACK'))
+        info = simplejson.dumps({'tips': self.cache.get_tips(), 'count': 7,
+            'pack': os.path.basename(pack_path)})
+        self.cache._write(self.cache.info_path, lambda f: f.write(info))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _get(self, wants):
+        cached = self.cache.get(wants)
+        if cached is None:
+            return None
+        pack, count = cached
+        try:
+            return pack.read(), count
+        finally:
+            pack.close()
+
+    def test_get(self):
+        self.assertEqual(self._get(['a' * 40, 'b' * 40]), ('PACK', 7))
+        self.assertEqual(self._get(['b' * 40]), ('PACK', 7))
+        self.assertEqual(self._get(['c' * 40]), None)
+
+    def test_outdated(self):
+        self.repo.refs['refs/heads/master'] = 'c' * 40
+        self.assertEqual(self._get(['c' * 40]), None)
+
+    def test_clear(self):
+        self.cache.clear()
+        self.assertEqual(self._get(['a' * 40]), None)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+def pkt_line(data):
+    return '%04x%s' % (len(data) + 4, data)
+
+def get_sideband_data(content):
+    """
+    Returns data sent at the first sideband channel (pack data) within given
+    pkt-lines ``content``.
+    """
+    data = []
+    while content:
+        size = int(content[:4], 16)
+        line, content = content[4:max(size, 4)], content[max(size, 4):]
+        if line.startswith('\x01'):
+            data.append(line[1:])
+    return ''.join(data)
+
+
+def add_commit(repo, message, parents=()):
+    """
+    Adds commit with a single file to the dulwich ``repo`` and points its
+    master branch to it.
+    """
+    blob = Blob.from_string(message)
+    tree = Tree()
+    tree['README'] = (0100644, blob.id)
+    commit = Commit()
+    commit.tree = tree.id
+    commit.parents = list(parents)
+    commit.author = commit.committer = 'Joe <joe@example.com>'
+    commit.commit_time = commit.author_time = 1285000000
+    commit.commit_timezone = commit.author_timezone = 0
+    commit.message = message
+    for obj in (blob, tree, commit):
+        repo.object_store.add_object(obj)
+    repo.refs['refs/heads/master'] = commit.id
+    return commit
+
+def get_git_request(service, body, **meta):
+    """
+    Returns request of git's smart HTTP ``service`` with given ``body``.
+    """
+    request = HttpRequest()
+    request.method = 'POST'
+    request.META = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/%s' % service,
+        'QUERY_STRING': '',
+        'CONTENT_TYPE': 'application/x-%s-request' % service,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': StringIO.StringIO(body),
+    }
+    request.META.update(meta)
+    return request
+
+
+class DulwichRepository(object):
+    """
+    Mimics ``vcs.web.simplevcs.models.Repository`` and vcs repository, which
+    expose underlying dulwich repository as ``_repo``.
+    """
+
+    def __init__(self, repo):
+        self._repo = repo
+
+
+class ClonePackTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.repo = Repo.init(self.path)
+        self.commit = add_commit(self.repo, 'Initial commit')
+        self.cache = ClonePackCache(self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _clone(self):
+        """
+        Returns pack data sent by upload-pack service to a fresh clone.
+        """
+        body = pkt_line('want %s side-band-64k\n' % self.commit.id) +\
+            '0000' + pkt_line('done\n')
+        request = get_git_request('git-upload-pack', body)
+        server = GitWebServer(DulwichRepository(DulwichRepository(self.repo)))
+        response = server.get_response(request)
+        self.assertEqual(response.status_code, 200)
+        return get_sideband_data(response.content)
+
+    def _get_pack_paths(self):
+        return glob.glob(os.path.join(self.repo.controldir(), '*.pack'))
+
+    def test_clone_from_cached_pack(self):
+        self.assertEqual(self.cache.build(), 3)
+        pack_paths = self._get_pack_paths()
+        self.assertEqual(len(pack_paths), 1)
+        data = self._clone()
+        self.assertEqual(data, open(pack_paths[0], 'rb').read())
+        self.assertEqual(struct.unpack('>L', data[8:12])[0], 3)
+        # Cached pack is sent as is
+        open(pack_paths[0], 'wb').write('PACK cached')
+        self.assertEqual(self._clone(), 'PACK cached')
+
+    def test_clone_without_cached_pack(self):
+        data = self._clone()
+        self.assertTrue(data.startswith('PACK'))
+        self.assertEqual(struct.unpack('>L', data[8:12])[0], 3)
+
+    def test_outdated_pack(self):
+        self.cache.build()
+        self.commit = add_commit(self.repo, 'Second commit',
+            parents=[self.commit.id])
+        # Refs changed, pack is not used until it is rebuilt
+        self.assertEqual(self.cache.get([self.commit.id]), None)
+        self.assertEqual(struct.unpack('>L', self._clone()[8:12])[0], 6)
+
+        self.assertEqual(self.cache.build(), 6)
+        # Pack built for previous refs is removed
+        pack_paths = self._get_pack_paths()
+        self.assertEqual(len(pack_paths), 1)
+        self.assertEqual(self._clone(), open(pack_paths[0], 'rb').read())
+
+
+class ChunkedPushTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.repo = Repo.init(self.path)
+        self.commit = add_commit(self.repo, 'Initial commit')
+        self._decode = projector_settings.GIT_DECODE_CHUNKED_INPUT
+
+    def tearDown(self):
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = self._decode
+        shutil.rmtree(self.path)
+
+    def _get_push_body(self):
+        """
+        Returns receive-pack request body pushing new commit (created at
+        other repository) to the master branch, and the commit.
+        """
+        path = tempfile.mkdtemp()
+        try:
+            source = Repo.init(path)
+            parent = add_commit(source, 'Initial commit')
+            commit = add_commit(source, 'Pushed commit', parents=[parent.id])
+            object_store = source.object_store
+            objects = object_store.iter_shas(object_store.find_missing_objects(
+                [parent.id], [commit.id], lambda msg: None))
+            pack = StringIO.StringIO()
+            write_pack_data(pack, objects, len(objects))
+        finally:
+            shutil.rmtree(path)
+        body = pkt_line('%s %s refs/heads/master\x00report-status\n'
+            % (parent.id, commit.id)) + '0000' + pack.getvalue()
+        return body, commit
+
+    def _push(self, body, **meta):
+        request = get_git_request('git-receive-pack', body,
+            HTTP_TRANSFER_ENCODING='chunked', CONTENT_LENGTH='', **meta)
+        server = GitWebServer(DulwichRepository(DulwichRepository(self.repo)))
+        response = server.get_response(request)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_raw_chunked_body(self):
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = True
+        body, commit = self._get_push_body()
+        # Server passes body as it was received
+        chunked = ''.join('%x\r\n%s\r\n' % (len(body[i:i + 100]),
+            body[i:i + 100]) for i in xrange(0, len(body), 100)) + '0\r\n\r\n'
+        content = self._push(chunked)
+        self.assertTrue('unpack ok' in content)
+        self.assertEqual(self.repo.refs['refs/heads/master'], commit.id)
+        self.assertEqual(self.repo[commit.id].message, 'Pushed commit')
+
+    def test_decoded_chunked_body(self):
+        projector_settings.GIT_DECODE_CHUNKED_INPUT = False
+        body, commit = self._get_push_body()
+        # Server has decoded the body, without announcing it
+        content = self._push(body)
+        self.assertTrue('unpack ok' in content)
+        self.assertEqual(self.repo.refs['refs/heads/master'], commit.id)
@@ -1,13 +1,17 @@
 import urlparse
 
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import AnonymousUser, User, Group
 from django.core.urlresolvers import reverse
+from django.test import TestCase
 from django.test.client import Client
 
+from projector import settings as projector_settings
+from projector.core.permissions import get_cached, get_permission_resolver
 from projector.tests.base import ProjectorTestCase
-from projector.models import Project, Membership, Team
+from projector.models import Project, ProjectVisibility, Membership, Team,\
+    Visibility
 
-from guardian.shortcuts import assign
+from guardian.shortcuts import assign, remove_perm
 
 class ProjectorPermissionTests(ProjectorTestCase):
 
@@ -188,3 +192,139 @@ class ProjectorPermissionTests(ProjectorTestCase):
 
         self.client.logout()
 
+
+
+class PermissionResolverTest(TestCase):
+
+    def setUp(self):
+        self._shared_cache = projector_settings.SHARED_CACHE
+        projector_settings.SHARED_CACHE = True
+        self.author = User.objects.create(username='author', is_active=True)
+        self.user = User.objects.create(username='resolved', is_active=True)
+        self.project = Project.objects.create_project(
+            name='resolver-project', author=self.author)
+        self.group = Group.objects.create(name='resolver-team')
+        self.user.groups.add(self.group)
+
+    def tearDown(self):
+        projector_settings.SHARED_CACHE = self._shared_cache
+
+    def test_direct_and_group_perms(self):
+        assign('view_project', self.user, self.project)
+        assign('can_view_tasks', self.group, self.project)
+        resolver = get_permission_resolver(self.user)
+        self.assertEqual(resolver.get_codenames(self.project),
+            set(['view_project', 'can_view_tasks']))
+        self.assertTrue(resolver.has_perm('can_view_tasks', self.project))
+        self.assertFalse(resolver.has_perm('can_add_task', self.project))
+        # Resolver is shared and memoized
+        self.assertTrue(get_permission_resolver(self.user) is resolver)
+        assign('can_add_task', self.user, self.project)
+        self.assertFalse(resolver.has_perm('can_add_task', self.project))
+        resolver.clear(self.project)
+        self.assertTrue(resolver.has_perm('can_add_task', self.project))
+
+    def test_inactive(self):
+        assign('view_project', self.user, self.project)
+        self.user.is_active = False
+        resolver = get_permission_resolver(self.user)
+        self.assertFalse(resolver.has_perm('view_project', self.project))
+
+    def _get_resolver(self):
+        # Fresh user instance, as it would be fetched by another request
+        return get_permission_resolver(User.objects.get(pk=self.user.pk))
+
+    def test_cache_invalidation(self):
+        self.assertFalse(self._get_resolver().has_perm('view_project',
+            self.project))
+        assign('view_project', self.user, self.project)
+        self.assertTrue(self._get_resolver().has_perm('view_project',
+            self.project))
+
+        other_group = Group.objects.create(name='resolver-other-team')
+        assign('can_add_task', other_group, self.project)
+        self.assertFalse(self._get_resolver().has_perm('can_add_task',
+            self.project))
+        self.user.groups.add(other_group)
+        self.assertTrue(self._get_resolver().has_perm('can_add_task',
+            self.project))
+        other_group.user_set.clear()
+        self.assertFalse(self._get_resolver().has_perm('can_add_task',
+            self.project))
+
+    def test_cached_perms(self):
+        assign('can_view_tasks', self.group, self.project)
+        team = Team.objects.create(project=self.project, group=self.group)
+        self.assertEqual(Team.objects.get(pk=team.pk).perms,
+            ['can_view_tasks'])
+        remove_perm('can_view_tasks', self.group, self.project)
+        self.assertEqual(Team.objects.get(pk=team.pk).perms, [])
+
+    def test_not_shared_cache(self):
+        projector_settings.SHARED_CACHE = False
+        calls = []
+        loader = lambda: calls.append(1) or len(calls)
+        self.assertEqual(get_cached('test', self.project, loader), 1)
+        self.assertEqual(get_cached('test', self.project, loader), 2)
+        projector_settings.SHARED_CACHE = True
+        self.assertEqual(get_cached('test', self.project, loader), 3)
+        self.assertEqual(get_cached('test', self.project, loader), 3)
+
+
+class ProjectVisibilityTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username='visibility-author',
+            is_active=True)
+        self.user = User.objects.create(username='visibility-user',
+            is_active=True)
+        self.public = Project.objects.create_project(name='visible-public',
+            author=self.author, public=True)
+        self.private = Project.objects.create_project(name='visible-private',
+            author=self.author, public=False)
+        self.hidden = Project.objects.create_project(name='visible-hidden',
+            author=self.author, public=False)
+        self.group = Group.objects.create(name='visibility-team')
+
+    def test_for_user(self):
+        names = lambda qs: [p.name for p in qs.filter(author=self.author)]
+        self.assertEqual(names(Project.objects.for_user(self.user)),
+            ['visible-public'])
+        # Member both directly and by team - still listed once
+        Membership.objects.create(member=self.user, project=self.private)
+        Membership.objects.create(member=self.user, project=self.public)
+        Team.objects.create(group=self.group, project=self.private)
+        self.user.groups.add(self.group)
+        self.assertEqual(names(Project.objects.for_user(self.user)),
+            ['visible-private', 'visible-public'])
+        self.assertEqual(names(Project.objects.for_user(None)),
+            ['visible-public'])
+
+        self.assertEqual(names(Project.objects.for_member(self.user,
+            self.user)), ['visible-private', 'visible-public'])
+        self.assertEqual(names(Project.objects.for_member(self.user,
+            AnonymousUser())), ['visible-public'])
+
+    def test_visibility_table(self):
+        Membership.objects.create(member=self.user, project=self.private)
+        Team.objects.create(group=self.group, project=self.hidden)
+        self.user.groups.add(self.group)
+        self.assertEqual(ProjectVisibility.objects.check(), (set(), set()))
+        self.assertTrue(self.private.is_visible_for(self.user))
+        self.assertTrue(self.hidden.is_visible_for(self.user))
+
+        self.group.user_set.clear()
+        self.assertFalse(self.hidden.is_visible_for(self.user))
+        Membership.objects.filter(member=self.user).delete()
+        self.assertFalse(self.private.is_visible_for(self.user))
+        self.assertTrue(self.public.is_visible_for(AnonymousUser()))
+
+        # Rows removed behind listeners' back are found and repaired
+        self.user.groups.add(self.group)
+        ProjectVisibility.objects.all().delete()
+        missing, stale = ProjectVisibility.objects.check()
+        self.assertTrue((self.user.pk, self.hidden.pk, Visibility.TEAM)
+            in missing)
+        ProjectVisibility.objects.refresh()
+        self.assertEqual(ProjectVisibility.objects.check(), (set(), set()))
+        self.assertTrue(self.hidden.is_visible_for(self.user))
@@ -1,9 +1,10 @@
 import inspect
 
+from django.core.cache import cache
 from django.test import TestCase
 
 from projector import settings
-from projector.models import Project
+from projector.models import Config, Project
 from projector.forms import ProjectCreateForm
 from projector.forms import ProjectMembershipPermissionsForm
 from projector.forms import ProjectTeamPermissionsForm
@@ -81,3 +82,38 @@ class SettingsTest(TestCase):
         settings.FORK_EXTERNAL_MAP = {'not': 'empty'}
         self.assertFalse(can_fork_external())
 
+
+class ConfigCacheTest(TestCase):
+
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        self._shared_cache = settings.SHARED_CACHE
+        settings.SHARED_CACHE = True
+
+    def tearDown(self):
+        settings.SHARED_CACHE = self._shared_cache
+
+    def test_config_cache(self):
+        project = Project.objects.with_related().get(name='public project')
+        key = Config.get_cache_key(project.pk)
+        cache.delete(key)
+        config = project.config
+        self.assertTrue(project.config is config)
+        self.assertEqual(cache.get(key).pk, config.pk)
+
+        # Saved config is removed from the cache
+        config.basic_realm = u'Changed realm'
+        config.save()
+        self.assertEqual(cache.get(key), None)
+        project = Project.objects.get(pk=project.pk)
+        self.assertEqual(project.config.basic_realm, u'Changed realm')
+
+    def test_not_shared_cache(self):
+        settings.SHARED_CACHE = False
+        project = Project.objects.get(name='public project')
+        key = Config.get_cache_key(project.pk)
+        cache.delete(key)
+        config = project.config
+        self.assertTrue(project.config is config)
+        self.assertEqual(cache.get(key), None)
@@ -0,0 +1,486 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client
+from django.utils.datastructures import SortedDict
+
+from projector.models import Action, Project, Task, TaskIdSequence,\
+    TaskRevision, TaskSearchTerm, Milestone, Status, WatchedItem
+from projector import settings as projector_settings
+from projector.utils.pagination import KeysetPaginator
+
+
+class TaskTestMixin(object):
+    """
+    Creates project with ``self.user`` as its author.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username = 'tasker',
+            email = 'tasker@example.com',
+            is_active = True)
+        self.project = Project.objects.create_project(
+            name = 'task-test-project',
+            author = self.user,
+        )
+
+    def _create_task(self, summary='Task summary'):
+        task = Task.objects.get_for_project(self.project)
+        task.summary = summary
+        task.description = 'Example description'
+        task.author = task.editor = self.user
+        task.author_ip = task.editor_ip = '127.0.0.1'
+        task.save()
+        return task
+
+
+class TaskIdSequenceTest(TaskTestMixin, TestCase):
+
+    def test_consecutive_ids(self):
+        ids = [self._create_task().id for i in xrange(3)]
+        self.assertEqual(ids, [1, 2, 3])
+        sequence = TaskIdSequence.objects.get(project=self.project)
+        self.assertEqual(sequence.last_id, 3)
+
+    def test_reserve_block(self):
+        self._create_task()
+        first = TaskIdSequence.objects.reserve(self.project, 10)
+        self.assertEqual(first, 2)
+        self.assertEqual(self._create_task().id, 12)
+
+    def test_existing_tasks(self):
+        # Projects with tasks created before sequence row existed should
+        # continue their numbering
+        task = self._create_task()
+        TaskIdSequence.objects.filter(project=self.project).delete()
+        Task.objects.filter(pk=task.pk).update(id=7)
+        self.assertEqual(self._create_task().id, 8)
+
+    def test_reserve_nothing(self):
+        self.assertRaises(ValueError, TaskIdSequence.objects.reserve,
+            self.project, 0)
+
+
+class TaskIdSequenceTransactionTest(TaskTestMixin, TransactionTestCase):
+
+    def _get_last_id(self):
+        return TaskIdSequence.objects.get(project=self.project).last_id
+
+    def test_own_transaction(self):
+        self.assertEqual(TaskIdSequence.objects.reserve(self.project, 3), 1)
+        # Reservation is committed, nothing is left pending
+        self.assertFalse(transaction.is_dirty())
+        transaction.rollback()
+        self.assertEqual(self._get_last_id(), 3)
+
+    def test_callers_transaction(self):
+        TaskIdSequence.objects.reserve(self.project, 3)
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            self.assertEqual(TaskIdSequence.objects.reserve(self.project, 5),
+                4)
+            self.assertEqual(TaskIdSequence.objects.reserve(self.project, 1),
+                9)
+            # Caller's transaction is not committed by reservation
+            transaction.rollback()
+        finally:
+            transaction.leave_transaction_management()
+        self.assertEqual(self._get_last_id(), 3)
+
+
+class TaskRevisionDeltaTest(TaskTestMixin, TestCase):
+
+    def setUp(self):
+        super(TaskRevisionDeltaTest, self).setUp()
+        self._interval = projector_settings.TASK_REVISION_SNAPSHOT_INTERVAL
+        projector_settings.TASK_REVISION_SNAPSHOT_INTERVAL = 3
+        self.task = self._create_task()
+        self.task.create_revision()
+        self.descriptions = [self.task.description]
+        for i in xrange(6):
+            lines = [u'Line %d of the description\n' % l for l in xrange(30)]
+            lines[i] = u'Edited line\n'
+            self.task.description = u''.join(lines)
+            self.task.save()
+            self.task.create_revision()
+            self.descriptions.append(self.task.description)
+
+    def tearDown(self):
+        projector_settings.TASK_REVISION_SNAPSHOT_INTERVAL = self._interval
+
+    def test_storage(self):
+        snapshots = TaskRevision.objects\
+            .filter(task=self.task, description_delta=None)\
+            .values_list('revision', flat=True)
+        # First, each third and the newest one
+        self.assertEqual(list(snapshots), [0, 3, 6])
+
+    def test_get_revisions(self):
+        revisions = self.task.get_revisions(force_query=True)
+        self.assertEqual([r.description for r in revisions], self.descriptions)
+        self.assertEqual(revisions[5].changes.keys(), ['description'])
+
+    def test_get_description(self):
+        revision = TaskRevision.objects.get(task=self.task, revision=4)
+        self.assertFalse(revision.is_snapshot())
+        self.assertEqual(revision.get_description(), self.descriptions[4])
+
+    def test_compact_revisions(self):
+        revisions = TaskRevision.objects.filter(task=self.task)
+        for revision in self.task.get_revisions(force_query=True):
+            revisions.filter(pk=revision.pk).update(
+                description=revision.description, description_delta=None)
+        self.assertEqual(self.task.compact_revisions(), 4)
+        self.assertEqual(revisions.filter(description_delta=None).count(), 3)
+        self.assertEqual(self.task.compact_revisions(), 0)
+
+class TaskRevisionChangesTest(TaskTestMixin, TestCase):
+
+    def setUp(self):
+        super(TaskRevisionChangesTest, self).setUp()
+        self.task = self._create_task(summary='First summary')
+        self.task.create_revision()
+        self.task.summary = 'Second summary'
+        self.task.save()
+        self.task.create_revision()
+
+    def test_stored_changes(self):
+        revisions = TaskRevision.objects.filter(task=self.task)\
+            .order_by('revision')
+        self.assertEqual(revisions[0].changes, {})
+        self.assertEqual(revisions[1].changes.items(),
+            [('summary', (u'Second summary', u'First summary'))])
+
+    def test_missing_changes(self):
+        TaskRevision.objects.filter(task=self.task).update(changes=None)
+        revisions = self.task.get_revisions(force_query=True)
+        self.assertEqual(revisions[1].changes.keys(), ['summary'])
+        self.assertEqual(TaskRevision.objects\
+            .filter(task=self.task, changes=None).count(), 0)
+        self.assertEqual(self.task.store_revision_changes(), 0)
+
+    def test_truncated_description(self):
+        self.task.description = u'Long description ' * 100
+        self.task.save()
+        revision = self.task.create_revision()
+        current, previous = TaskRevision.objects.get(pk=revision.pk)\
+            .changes['description']
+        self.assertEqual(current,
+            self.task.description[:Task.CHANGESET_TRUNCATE_LENGTH] + u'...')
+        self.assertEqual(previous, u'Example description')
+
+    def test_truncate_stored_changes(self):
+        description = u'Long description ' * 100
+        revisions = TaskRevision.objects.filter(task=self.task, revision=1)
+        revisions.update(changes=SortedDict([
+            ('description', (description, u'Example description'))]))
+        call_command('store_task_revision_changes', verbosity=0)
+        self.assertEqual(revisions[0].changes['description'],
+            (description[:Task.CHANGESET_TRUNCATE_LENGTH] + u'...',
+             u'Example description'))
+
+class TaskRevisionWindowTest(TaskTestMixin, TestCase):
+
+    def setUp(self):
+        super(TaskRevisionWindowTest, self).setUp()
+        self.task = self._create_task(summary='Summary 0')
+        self.task.create_revision()
+        for i in xrange(1, 5):
+            self.task.summary = 'Summary %d' % i
+            self.task.save()
+            self.task.create_revision()
+
+    def test_windows(self):
+        revisions, cursor = self.task.get_revision_window(limit=2)
+        self.assertEqual([r.revision for r in revisions], [4, 3])
+        self.assertEqual(cursor, 3)
+
+        revisions, cursor = self.task.get_revision_window(before=cursor,
+            limit=2)
+        self.assertEqual([r.revision for r in revisions], [2, 1])
+        # Changes are available at window's boundary, too
+        self.assertEqual(revisions[-1].changes['summary'],
+            (u'Summary 1', u'Summary 0'))
+
+        revisions, cursor = self.task.get_revision_window(before=cursor,
+            limit=2)
+        self.assertEqual([r.revision for r in revisions], [0])
+        self.assertEqual(cursor, None)
+
+
+class TaskImportMixin(TaskTestMixin):
+
+    def _build_tasks(self, count):
+        for i in xrange(count):
+            task = Task.objects.get_for_project(self.project)
+            task.summary = 'Imported task %d' % i
+            task.description = 'Imported description'
+            task.author = self.user
+            task.author_ip = ''
+            yield task
+
+
+class TaskBulkImportTest(TaskImportMixin, TestCase):
+
+    def test_import(self):
+        self._create_task()
+        self.project.watch(self.user)
+        outbox = len(mail.outbox)
+
+        imported = Task.objects.bulk_import(self.project,
+            self._build_tasks(7), batch_size=3)
+        self.assertEqual(imported, 7)
+
+        tasks = Task.objects.filter(project=self.project).order_by('id')
+        self.assertEqual([task.id for task in tasks], range(1, 9))
+        self.assertEqual(tasks[1].summary, 'Imported task 0')
+        self.assertEqual(tasks[1].editor, self.user)
+        self.assertEqual(TaskRevision.objects\
+            .filter(task__project=self.project, revision=0).count(), 7)
+        self.assertEqual(Action.objects.filter(project=self.project,
+            verb="created new task").count(), 8)
+        # Next task continues numbering
+        self.assertEqual(self._create_task().id, 9)
+        # Only one summary message is sent
+        self.assertEqual(len(mail.outbox), outbox + 1)
+
+    def test_import_without_notification(self):
+        self.project.watch(self.user)
+        outbox = len(mail.outbox)
+        Task.objects.bulk_import(self.project, self._build_tasks(2),
+            notify=False)
+        self.assertEqual(len(mail.outbox), outbox)
+
+
+class TaskBulkImportTransactionTest(TaskImportMixin, TransactionTestCase):
+
+    def test_failed_batch(self):
+        manager = TaskSearchTerm.objects
+        index_tasks = manager.index_tasks
+        batches = []
+
+        def failing_index_tasks(tasks):
+            batches.append(tasks)
+            if len(batches) == 2:
+                raise ValueError("Import failure")
+            return index_tasks(tasks)
+
+        manager.index_tasks = failing_index_tasks
+        try:
+            self.assertRaises(ValueError, Task.objects.bulk_import,
+                self.project, self._build_tasks(7), batch_size=3)
+        finally:
+            del manager.index_tasks
+        # First batch is imported, nothing is left from the failed one
+        self.assertEqual(Task.objects.filter(project=self.project).count(), 3)
+        self.assertEqual(TaskRevision.objects\
+            .filter(task__project=self.project).count(), 3)
+        self.assertEqual(Action.objects.filter(project=self.project,
+            verb="created new task").count(), 3)
+
+
+class TaskSearchTest(TaskTestMixin, TestCase):
+
+    def search(self, query):
+        return [task.id for task in Task.objects.search(query, self.project)]
+
+    def test_search(self):
+        first = self._create_task('Broken login form')
+        second = self._create_task('Login page layout')
+        self.assertEqual(sorted(self.search('LOGIN')), [first.id, second.id])
+        self.assertEqual(self.search('broken login'), [first.id])
+        self.assertEqual(self.search('missing'), [])
+        self.assertEqual(self.search('!'), [])
+
+    def test_ranking(self):
+        first = self._create_task('Example task')
+        second = self._create_task('Other task')
+        # Terms found at summary weigh more than those at description
+        self.assertEqual(self.search('example'), [first.id, second.id])
+
+    def test_incremental_update(self):
+        task = self._create_task('Old summary')
+        task = Task.objects.get(pk=task.pk)
+        task.summary = 'New summary'
+        task.comment = 'Renamed after review'
+        task.editor_ip = '127.0.0.1'
+        task.save()
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), [task.id])
+        self.assertEqual(self.search('review'), [task.id])
+
+    def test_rebuild(self):
+        task = self._create_task('Indexed task')
+        TaskSearchTerm.objects.all().delete()
+        self.assertEqual(self.search('indexed'), [])
+        self.assertEqual(TaskSearchTerm.objects.rebuild(self.project), 1)
+        self.assertEqual(self.search('indexed'), [task.id])
+
+
+class TaskPaginationTest(TaskTestMixin, TestCase):
+
+    def setUp(self):
+        super(TaskPaginationTest, self).setUp()
+        self.owner = User.objects.create(username='owner',
+            email='owner@example.com')
+        for summary in ('c', 'a', 'b', 'a', 'c'):
+            self._create_task(summary)
+        Task.objects.filter(project=self.project, id__in=[2, 3])\
+            .update(owner=self.owner)
+        self.tasks = Task.objects.filter(project=self.project)
+
+    def browse(self, paginator):
+        ids, page = [], paginator.page()
+        while True:
+            ids.append([task.id for task in page])
+            if not page.has_next():
+                break
+            page = paginator.page(after=page.next_cursor)
+        # Going back should give the same pages
+        back = [[task.id for task in page]]
+        while page.has_previous():
+            page = paginator.page(before=page.previous_cursor)
+            back.insert(0, [task.id for task in page])
+        self.assertEqual(back, ids)
+        return ids
+
+    def test_id(self):
+        paginator = KeysetPaginator(self.tasks, 'id', 2, descending=True)
+        self.assertEqual(self.browse(paginator), [[5, 4], [3, 2], [1]])
+
+    def test_ties(self):
+        paginator = KeysetPaginator(self.tasks, 'summary', 2)
+        self.assertEqual(self.browse(paginator), [[2, 4], [3, 1], [5]])
+
+    def test_nullable(self):
+        paginator = KeysetPaginator(self.tasks, 'owner__username', 2,
+            nullable=True)
+        self.assertEqual(self.browse(paginator), [[1, 4], [5, 2], [3]])
+        paginator.descending = True
+        self.assertEqual(self.browse(paginator), [[3, 2], [5, 4], [1]])
+
+    def test_missing_cursor(self):
+        paginator = KeysetPaginator(self.tasks, 'id', 2)
+        self.assertEqual([task.id for task in paginator.page(after=100)],
+            [1, 2])
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(self.tasks, 'id', 2)
+        self.assertEqual([task.id for task in paginator.page(after='abc')],
+            [1, 2])
+        self.assertEqual([task.id for task in paginator.page(before='abc')],
+            [1, 2])
+
+    def test_invalid_cursor_url(self):
+        url = reverse('projector_task_list', kwargs={
+            'username': self.user.username,
+            'project_slug': self.project.slug})
+        for param in ('after', 'before'):
+            response = Client().get(url, {param: 'abc'})
+            self.assertEqual(response.status_code, 200)
+
+
+class TaskWatchTest(TaskTestMixin, TestCase):
+
+    def test_watched_ids(self):
+        tasks = [self._create_task() for i in xrange(3)]
+        tasks[0].watch(self.user)
+        tasks[2].watch(self.user)
+        expected = set([tasks[0].pk, tasks[2].pk])
+        self.assertEqual(WatchedItem.objects.watched_ids(self.user, Task),
+            expected)
+        self.assertEqual(WatchedItem.objects.watched_ids(self.user,
+            Task.objects.filter(pk__in=[tasks[0].pk, tasks[1].pk])),
+            set([tasks[0].pk]))
+        self.assertEqual(WatchedItem.objects.watched_ids(self.user,
+            tasks[1:]), set([tasks[2].pk]))
+        self.assertEqual(WatchedItem.objects.watched_ids(AnonymousUser(),
+            Task), set())
+
+    def test_is_watched(self):
+        task = self._create_task()
+        self.assertFalse(task.is_watched(self.user))
+        self.assertTrue(hasattr(self.user, '_watched_ids'))
+        task.watch(self.user)
+        self.assertTrue(task.is_watched(self.user))
+        task.unwatch(self.user)
+        self.assertFalse(task.is_watched(self.user))
+        self.assertFalse(task.is_watched(AnonymousUser()))
+
+
+class TaskCountersTest(TaskTestMixin, TestCase):
+
+    def setUp(self):
+        super(TaskCountersTest, self).setUp()
+        self.new = self.project.status_set.get(is_initial=True)
+        self.closed = Status.objects.create(project=self.project,
+            name='closed', order=2, is_resolved=True)
+        self.milestone = Milestone.objects.create(project=self.project,
+            name='1.0', description='First release', author=self.user)
+
+    def assertCounters(self, obj, total, resolved=None):
+        obj = type(obj).objects.get(pk=obj.pk)
+        self.assertEqual(obj.task_count, total)
+        if resolved is not None:
+            self.assertEqual(obj.resolved_task_count, resolved)
+
+    def test_counters(self):
+        task = self._create_task()
+        self._create_task()
+        self.assertCounters(self.project, 2, 0)
+        self.assertCounters(self.new, 2)
+
+        task = Task.objects.get(pk=task.pk)
+        task.status = self.closed
+        task.milestone = self.milestone
+        task.save()
+        self.assertCounters(self.project, 2, 1)
+        self.assertCounters(self.milestone, 1, 1)
+        self.assertCounters(self.new, 1)
+        self.assertCounters(self.closed, 1)
+
+        # Stale instance should not overwrite counters
+        self.milestone.save()
+        self.assertCounters(self.milestone, 1, 1)
+
+        task.delete()
+        self.assertCounters(self.project, 1, 0)
+        self.assertCounters(self.milestone, 0, 0)
+        self.assertCounters(self.closed, 0)
+
+    def test_status_resolved_flag(self):
+        self._create_task()
+        self.new.is_resolved = True
+        self.new.save()
+        self.assertCounters(self.project, 1, 1)
+
+    def test_recount(self):
+        task = self._create_task()
+        Task.objects.filter(pk=task.pk).update(status=self.closed,
+            milestone=self.milestone)
+        Project.objects.filter(pk=self.project.pk).update(task_count=7)
+        self.project.recount_tasks()
+        self.assertCounters(self.project, 1, 1)
+        self.assertCounters(self.milestone, 1, 1)
+        self.assertCounters(self.new, 0)
+        self.assertCounters(self.closed, 1)
+
+    def test_milestone_with_progress(self):
+        task = self._create_task()
+        self._create_task()
+        Task.objects.filter(pk=task.pk).update(status=self.closed,
+            milestone=self.milestone)
+        # Counters are not touched by queryset updates, annotations are exact
+        milestone = Milestone.objects.with_progress().get(pk=self.milestone.pk)
+        self.assertEqual(milestone.get_tasks_count(), 1)
+        self.assertEqual(milestone.get_finished_tasks_count(), 1)
+        self.assertEqual(milestone.get_unfinished_tasks_count(), 0)
+        self.assertEqual(milestone.get_finished_tasks_count_as_percentage(),
+            100)
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.get_tasks_count(), 0)
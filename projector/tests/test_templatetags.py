@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.template import Template, Context
 
 from projector.settings import get_config_value
+from projector.tests.test_tasks import TaskTestMixin
 
 def render(template, context):
     """
@@ -12,6 +13,12 @@ def render(template, context):
     return t.render(Context(context))
 
 
+class Changeset(object):
+
+    def __init__(self, message):
+        self.message = message
+
+
 class HideEmailTest(TestCase):
     """
     Tests against hide_email filter.
@@ -74,3 +81,31 @@ class HideEmailTest(TestCase):
             'Joe Doe [%(sub)s]\n'
             'Jack (%(sub)s)\n' % {'sub': 'HIDDEN_EMAIL'})
 
+
+
+class ChangesetMessageTest(TaskTestMixin, TestCase):
+    """
+    Tests against changeset_message filter.
+    """
+
+    def test_references(self):
+        open_task = self._create_task('Open task')
+        template = ''.join((
+            '{% load projector_tags %}',
+            '{% prefetch_task_references changesets project %}',
+            '{% for changeset in changesets %}',
+            '{{ changeset.message|changeset_message:project }}\n',
+            '{% endfor %}',
+        ))
+        changesets = [
+            Changeset(u"Refs #%d, see #100" % open_task.id),
+            Changeset(u"Don't fix #%d" % open_task.id),
+        ]
+        output = render(template, {'changesets': changesets,
+            'project': self.project})
+
+        self.assertEqual(self.project._tasks_by_id,
+            {open_task.id: open_task, 100: None})
+        self.assertEqual(output.count(open_task.get_absolute_url()), 2)
+        self.assertTrue('<span class="show-tipsy"' in output)
+        self.assertTrue('&#39;' in output)
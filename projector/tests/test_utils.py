@@ -1,6 +1,16 @@
+import os
+import shutil
+import tempfile
+import threading
+
 from django.test import TestCase
 
+from projector import settings as projector_settings
+from projector.core.repositories import RepositoryPool, invalidate_repository
+
+from projector.utils.delta import apply_delta, make_delta
 from projector.utils.email import extract_emails
+from projector.utils.search import get_term_weights, get_terms
 
 
 class ExtractEmailsTest(TestCase):
@@ -45,3 +55,108 @@ class ExtractEmailsTest(TestCase):
             set((extract_emails(text)))
         )
 
+
+
+class DeltaTest(TestCase):
+
+    def test_roundtrip(self):
+        pairs = (
+            (u'', u''),
+            (u'', u'foo\nbar'),
+            (u'foo\nbar', u''),
+            (u'foo\nbar\nbaz\n', u'foo\nbaz\n'),
+            (u'foo\nbar\nbaz\n', u'foo\nbar\nbar\nbaz\nqux'),
+            (u'foo\r\nbar', u'foo\r\nbaz'),
+        )
+        for source, target in pairs:
+            delta = make_delta(source, target)
+            self.assertEqual(apply_delta(source, delta), target)
+
+    def test_compact(self):
+        source = u''.join(u'line %d\n' % i for i in xrange(100))
+        target = source.replace(u'line 50\n', u'changed\n')
+        delta = make_delta(source, target)
+        self.assertTrue(len(delta) < len(target) / 10)
+
+
+class SearchTermsTest(TestCase):
+
+    def test_terms(self):
+        self.assertEqual(get_terms(u'Fix URL-parsing in a view'),
+            [u'fix', u'url', u'parsing', u'in', u'view'])
+        self.assertEqual(get_terms(None), [])
+        self.assertEqual(get_terms(u'x' * 60), [u'x' * 50])
+
+    def test_weights(self):
+        self.assertEqual(get_term_weights((u'Broken view', 3),
+            (u'The view fails', 1)),
+            {u'broken': 3, u'view': 4, u'the': 1, u'fails': 1})
+
+
+class RepositoryPoolTest(TestCase):
+
+    def setUp(self):
+        self.pool = RepositoryPool(size=2)
+        self.opened = []
+        self.root = tempfile.mkdtemp()
+        for name in 'abc':
+            os.makedirs(self._path(name, 'refs', 'heads'))
+        self._shared_cache = projector_settings.SHARED_CACHE
+        projector_settings.SHARED_CACHE = False
+
+    def tearDown(self):
+        projector_settings.SHARED_CACHE = self._shared_cache
+        shutil.rmtree(self.root)
+
+    def _path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def _open(self, name):
+        path = self._path(name)
+        return self.pool.get(path, lambda: self.opened.append(name) or path)
+
+    def test_reuse(self):
+        self._open('a')
+        self._open('a')
+        self.assertEqual(self.opened, ['a'])
+
+    def test_lru(self):
+        self._open('a')
+        self._open('b')
+        self._open('a')
+        # Least recently used repository is closed
+        self._open('c')
+        self.assertEqual(len(self.pool), 2)
+        self.assertTrue(self._path('a') in self.pool)
+        self.assertFalse(self._path('b') in self.pool)
+        self._open('b')
+        self.assertEqual(self.opened, ['a', 'b', 'c', 'b'])
+
+    def test_changed_on_disk(self):
+        self._open('a')
+        # Push handled by other process (which cache is not shared) updates
+        # a ref
+        heads = self._path('a', 'refs', 'heads')
+        open(os.path.join(heads, 'master'), 'w').write('0' * 40)
+        mtime = os.stat(heads).st_mtime
+        os.utime(heads, (mtime + 10, mtime + 10))
+        self._open('a')
+        self.assertEqual(self.opened, ['a', 'a'])
+
+    def test_invalidate(self):
+        projector_settings.SHARED_CACHE = True
+        self._open('a')
+        # Push could be handled by other process (with its own pool)
+        invalidate_repository(self._path('a'))
+        self._open('a')
+        self.assertEqual(self.opened, ['a', 'a'])
+
+    def test_threads(self):
+        self._open('a')
+        thread = threading.Thread(target=self._open, args=('a',))
+        thread.start()
+        thread.join()
+        # Repository opened by other thread is not shared
+        self.assertEqual(self.opened, ['a', 'a'])
+        self._open('a')
+        self.assertEqual(self.opened, ['a', 'a'])
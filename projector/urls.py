@@ -194,6 +194,9 @@ urlpatterns += patterns('projector.views.project_task',
     url(r'^(?P<username>[-\w]+)/(?P<project_slug>[-\w]+)/tasks/(?P<task_id>\d+)/edit/$',
         view='TaskEditView',
         name='projector_task_edit'),
+    url(r'^(?P<username>[-\w]+)/(?P<project_slug>[-\w]+)/tasks/(?P<task_id>\d+)/revisions/$',
+        view='TaskRevisionsView',
+        name='projector_task_revisions'),
     url(r'^(?P<username>[-\w]+)/(?P<project_slug>[-\w]+)/tasks/(?P<task_id>\d+)/watch/$',
         view='TaskWatchView',
         name='projector_task_watch'),
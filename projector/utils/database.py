@@ -0,0 +1,30 @@
+"""
+Database related helpers.
+"""
+from django.db import connection, transaction
+from django.db.models import AutoField
+
+def bulk_insert(model, objects):
+    """
+    Inserts given (unsaved) ``objects`` of the ``model`` with one
+    ``executemany`` call. Note that ``save`` method is not called, no signals
+    are sent and primary keys are *not* set on the given objects.
+
+    :param model: model class
+    :param objects: list of ``model`` instances
+    """
+    if not objects:
+        return
+    fields = [field for field in model._meta.local_fields
+        if not isinstance(field, AutoField)]
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    rows = [[field.get_db_prep_save(field.pre_save(obj, True),
+        connection=connection) for field in fields] for obj in objects]
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.commit_unless_managed()
+
@@ -0,0 +1,45 @@
+"""
+Compact, line based deltas between two texts.
+"""
+from difflib import SequenceMatcher
+
+from django.utils import simplejson
+
+def make_delta(source, target):
+    """
+    Returns delta (serialized as JSON string) which transforms ``source`` text
+    into ``target``. Delta is a list of chunks - pair of integers
+    ``[start, end]`` means that ``source`` lines from ``start`` up to ``end``
+    should be copied and a string is a text which should be inserted. In
+    example::
+
+        >>> make_delta(u'foo\\nbar\\n', u'foo\\nbaz\\n')
+        '[[0, 1], "baz\\\\n"]'
+
+    """
+    source_lines = source.splitlines(True)
+    target_lines = target.splitlines(True)
+    matcher = SequenceMatcher(None, source_lines, target_lines)
+    chunks = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            chunks.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            chunks.append(u''.join(target_lines[j1:j2]))
+    return simplejson.dumps(chunks)
+
+def apply_delta(source, delta):
+    """
+    Returns text created by applying ``delta`` (as returned by
+    :py:func:`make_delta`) on the ``source`` text.
+    """
+    source_lines = source.splitlines(True)
+    result = []
+    for chunk in simplejson.loads(delta):
+        if isinstance(chunk, basestring):
+            result.append(chunk)
+        else:
+            start, end = chunk
+            result.extend(source_lines[start:end])
+    return u''.join(result)
+
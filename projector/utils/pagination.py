@@ -0,0 +1,144 @@
+"""
+Keyset (cursor based) pagination.
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """
+    Single page returned by :py:class:`KeysetPaginator`. Cursors are values of
+    paginator's ``tiebreaker`` field of the boundary objects - ``None`` if
+    there is no next (or previous) page.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(object):
+    """
+    Paginates ``queryset`` ordered by ``field`` (and ``tiebreaker`` which
+    must be unique within the queryset) without ``OFFSET`` - each page is
+    fetched with condition on values of the boundary object, so page's cost
+    does not depend on its position, as long as there is an index on the
+    ordering columns.
+
+    ``field`` may span relations (``status__order``). If ``nullable`` is
+    ``True``, objects with ``NULL`` value are put before others in
+    ascending order (and after them in descending one) regardless of
+    database backend.
+
+    Cursors are ``tiebreaker`` values of boundary objects - ``field`` value
+    is retrieved from the database, so cursors are plain, url safe values.
+    """
+
+    def __init__(self, queryset, field, per_page, descending=False,
+            nullable=False, tiebreaker='id'):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+        self.descending = descending
+        self.nullable = nullable
+        self.tiebreaker = tiebreaker
+
+    def page(self, after=None, before=None):
+        """
+        Returns :py:class:`KeysetPage` with objects following the one pointed
+        by ``after`` cursor or preceding ``before`` one. If neither is given
+        (or object pointed by cursor doesn't exist anymore, or cursor is
+        invalid) first page is returned.
+        """
+        if before is not None:
+            key = self.get_key(before)
+            if key is not None:
+                objects = self._fetch(key, not self.descending)
+                has_previous = len(objects) > self.per_page
+                objects = objects[:self.per_page][::-1]
+                return self._get_page(objects, has_previous=has_previous,
+                    has_next=True)
+        key = after is not None and self.get_key(after) or None
+        objects = self._fetch(key, self.descending)
+        return self._get_page(objects[:self.per_page],
+            has_previous=key is not None,
+            has_next=len(objects) > self.per_page)
+
+    def get_key(self, cursor):
+        """
+        Returns pair of ``field`` and ``tiebreaker`` values of object pointed
+        by ``cursor`` or ``None`` if there is no such object (or ``cursor``
+        is not a valid ``tiebreaker`` value, i.e. taken from edited url).
+        """
+        field = self.queryset.model._meta.get_field(self.tiebreaker)
+        try:
+            cursor = field.to_python(cursor)
+        except ValidationError:
+            return None
+        keys = self.queryset\
+            .filter(**{self.tiebreaker: cursor})\
+            .values_list(self.field, self.tiebreaker)[:1]
+        return keys and keys[0] or None
+
+    def _get_page(self, objects, has_previous, has_next):
+        next_cursor = previous_cursor = None
+        if objects and has_next:
+            next_cursor = getattr(objects[-1], self.tiebreaker)
+        if objects and has_previous:
+            previous_cursor = getattr(objects[0], self.tiebreaker)
+        return KeysetPage(objects, next_cursor, previous_cursor)
+
+    def _fetch(self, key, descending):
+        """
+        Returns list of at most ``per_page + 1`` objects following ``key`` in
+        given direction.
+        """
+        limit = self.per_page + 1
+        null_segment = self.nullable and [True] or []
+        segments = descending and [False] + null_segment\
+            or null_segment + [False]
+        if key is not None:
+            # Skip segments preceding the one containing the key
+            segments = segments[segments.index(key[0] is None):]
+        objects = []
+        for is_null in segments:
+            queryset = self._get_segment(is_null, descending, key)
+            objects.extend(queryset[:limit - len(objects)])
+            if len(objects) >= limit:
+                break
+            key = None
+        return objects
+
+    def _get_segment(self, is_null, descending, key):
+        queryset = self.queryset
+        if self.nullable:
+            queryset = queryset.filter(**{self.field + '__isnull': is_null})
+        prefix = descending and '-' or ''
+        lookup = descending and '__lt' or '__gt'
+        if is_null:
+            ordering = (prefix + self.tiebreaker,)
+        else:
+            ordering = (prefix + self.field, prefix + self.tiebreaker)
+        queryset = queryset.order_by(*ordering)
+        if key is None:
+            return queryset
+        value, tiebreaker = key
+        after_tiebreaker = Q(**{self.tiebreaker + lookup: tiebreaker})
+        if is_null:
+            return queryset.filter(after_tiebreaker)
+        return queryset.filter(Q(**{self.field + lookup: value}) |
+            Q(**{self.field: value}) & after_tiebreaker)
+
@@ -0,0 +1,42 @@
+"""
+Text processing used by task search index.
+"""
+import re
+
+from django.utils.encoding import force_unicode
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+TERM_MIN_LENGTH = 2
+TERM_MAX_LENGTH = 50
+
+def get_terms(text):
+    """
+    Returns list of normalized (lowercased) terms found at the given
+    ``text``, in order of appearance. Terms shorter than 2 characters are
+    skipped and the longer ones are truncated to 50 characters::
+
+        >>> get_terms(u'Fix URL-parsing in a view')
+        [u'fix', u'url', u'parsing', u'in', u'view']
+
+    """
+    if not text:
+        return []
+    return [term[:TERM_MAX_LENGTH]
+        for term in TERM_RE.findall(force_unicode(text).lower())
+        if len(term) >= TERM_MIN_LENGTH]
+
+def get_term_weights(*weighted_texts):
+    """
+    Returns dictionary mapping terms to their weights. Each argument should be
+    a pair of text and weight of each term occurrence within it::
+
+        >>> get_term_weights((u'Broken view', 3), (u'The view fails', 1))
+        {u'broken': 3, u'view': 4, u'the': 1, u'fails': 1}
+
+    """
+    weights = {}
+    for text, weight in weighted_texts:
+        for term in get_terms(text):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
@@ -5,7 +5,6 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render_to_response
 from django.template import RequestContext
@@ -15,6 +14,7 @@ from django.utils.decorators import method_decorator
 
 from projector.core.controllers import View
 from projector.core.exceptions import ProjectorError
+from projector.core.permissions import get_permission_resolver
 from projector.models import Project, State
 from projector.forms import ProjectCreateForm, ProjectEditForm, ConfigForm,\
     ProjectForkForm
@@ -98,8 +98,8 @@ class ProjectView(View):
     def __init__(self, request, username=None, project_slug=None, *args,
             **kwargs):
         self.request = request
-        self.project = get_object_or_404(Project, slug=project_slug,
-            author__username=username)
+        self.project = get_object_or_404(Project.objects.with_related(),
+            slug=project_slug, author__username=username)
         self.author = self.project.author
         self.check_permissions()
         super(ProjectView, self).__init__(request=request, username=username,
@@ -170,8 +170,9 @@ class ProjectView(View):
         if self.project.author == self.request.user:
             return
         perms = self.get_required_perms()
+        resolver = get_permission_resolver(self.request.user)
         for perm in perms:
-            if not self.request.user.has_perm(perm, self.project):
+            if not resolver.has_perm(perm, self.project):
                 if settings.DEBUG:
                     logging.debug("User %s has no permission %s for project %s"
                         % (self.request.user, perm, self.project))
@@ -272,12 +273,13 @@ def _project_detail_hg(request, project):
         return ask_basic_auth(request,
             realm=project.config.basic_realm)
 
+    resolver = get_permission_resolver(request.user)
     if project.is_private() and request.method == 'GET' and\
-        not request.user.has_perm('can_read_repository', project):
+        not resolver.has_perm('can_read_repository', project):
         raise PermissionDenied("User %s cannot read repository for "
             "project %s" % (request.user, project))
     elif request.method == 'POST' and\
-        not request.user.has_perm('can_write_to_repository',project):
+        not resolver.has_perm('can_write_to_repository', project):
         raise PermissionDenied("User %s cannot write to repository "
             "for project %s" % (request.user, project))
 
@@ -304,16 +306,15 @@ class ProjectListView(View):
     **Additional context variables**
 
     * ``project_list``: :model:`Project` queryset filtered for request's user.
-      Additionally, projects are annotated with :model:`Task` count (available
-      as ``task__count`` attribute on each retrieved project).
+      :model:`Task` count is available as ``task_count`` attribute on each
+      retrieved project.
 
     """
 
     template_name = 'projector/project/list.html'
 
     def response(self, request):
-        project_list = Project.objects.for_user(user=request.user)\
-            .annotate(Count('task', distinct=True))
+        project_list = Project.objects.for_user(user=request.user)
         context = {
             'project_list' : project_list,
         }
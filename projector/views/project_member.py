@@ -12,7 +12,6 @@ from projector.forms import MembershipForm, ProjectMembershipPermissionsForm
 from projector.forms import MembershipDeleteForm
 
 from guardian.models import UserObjectPermission
-from guardian.shortcuts import get_perms
 
 class MemberListView(ProjectView):
     """
@@ -78,7 +77,7 @@ class MemberEditView(ProjectView):
             messages.warning(request, _("Project owner's membership cannot be "
                 "modified. He/She has all permissions for this project."))
             return redirect(project.get_members_url())
-        member_perms = get_perms(member, project)
+        member_perms = membership.perms
 
         form = ProjectMembershipPermissionsForm(request.POST or None,
             membership = membership,
@@ -1,4 +1,3 @@
-from django.db.models import Count
 from django.shortcuts import get_object_or_404, redirect
 from django.utils.translation import ugettext as _
 from django.contrib import messages
@@ -13,7 +12,6 @@ class MilestoneListView(ProjectView):
 
     def response(self, request, username, project_slug):
         milestone_list = self.project.milestone_set\
-            .annotate(Count('task'))\
             .order_by('-created_at')
         self.context['milestone_list'] = milestone_list
         return self.context
@@ -25,7 +23,6 @@ class MilestoneGanttView(MilestoneListView):
 
     def response(self, request, username, project_slug):
         milestone_list = self.project.milestone_set\
-            .annotate(Count('task'))\
             .order_by('created_at')
         self.context['milestone_list'] = milestone_list
         self.context['milestone_first'] = milestone_list and milestone_list[0]
@@ -47,7 +44,7 @@ class MilestoneDetailView(ProjectView):
     template_name = 'projector/project/milestones/detail.html'
 
     def response(self, request, username, project_slug, milestone_slug):
-        milestone = get_object_or_404(Milestone,
+        milestone = get_object_or_404(Milestone.objects.with_progress(),
             project=self.project, slug=milestone_slug)
         context = {
             'project': self.project,
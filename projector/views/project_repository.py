@@ -3,6 +3,7 @@ from django.utils.translation import ugettext as _
 from django.http import HttpResponse
 from django.shortcuts import redirect
 
+from projector.core.repositories import get_pooled_repository
 from projector.views.project import ProjectView
 from projector.utils.lazy import LazyProperty
 
@@ -36,9 +37,14 @@ class RepositoryView(ProjectView):
             msg = _("There is something wrong with project's repository")
             messages.error(self.request, msg)
             response = redirect(self.project)
-        elif not self.project.repository.revisions:
-            messages.info(self.request, _("Repository has no changesets yet"))
-            return RepositoryQuickstart(self.request, *self.args, **self.kwargs)
+        else:
+            # Repository opened by previous requests is reused
+            get_pooled_repository(self.project.repository)
+            if not self.project.repository.revisions:
+                messages.info(self.request,
+                    _("Repository has no changesets yet"))
+                return RepositoryQuickstart(self.request, *self.args,
+                    **self.kwargs)
         return response
 
     def get_error_response(self):
@@ -5,7 +5,7 @@ from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.utils.translation import ugettext as _
 from django.utils.decorators import method_decorator
 from django.utils.simplejson import dumps
@@ -13,6 +13,9 @@ from django.utils.simplejson import dumps
 from projector.models import Task
 from projector.forms import TaskForm, TaskEditForm
 from projector.filters import TaskFilter
+from projector.settings import get_config_value
+from projector.tasks import schedule_task_notification
+from projector.utils.pagination import KeysetPage, KeysetPaginator
 from projector.views.project import ProjectView
 
 from richtemplates.shortcuts import get_json_response
@@ -22,24 +25,118 @@ login_required_m = method_decorator(login_required)
 class TaskListView(ProjectView):
     """
     Task for project listing view.
+
+    Tasks are paginated by cursor (``after`` or ``before`` GET parameter is
+    id of the boundary task) and sorted by column given as ``sort``
+    parameter. Search results (``q`` parameter) are ordered by relevance
+    unless other order is requested - such lists are paginated by ``page``
+    number.
     """
 
     template_name='projector/project/task/list.html'
     perms_private = ['view_project', 'can_view_tasks']
 
+    # Maps sort parameter to ordering field and whether it may be null
+    sort_fields = {
+        'id': ('id', False),
+        'summary': ('summary', False),
+        'milestone': ('milestone__created_at', True),
+        'created_at': ('created_at', False),
+        'priority': ('priority__order', False),
+        'type': ('type__order', False),
+        'component': ('component__name', False),
+        'status': ('status__order', False),
+        'author': ('author__username', False),
+        'owner': ('owner__username', True),
+    }
+
     def response(self, request, username, project_slug):
-        task_list = Task.objects.filter(project__id=self.project.id)\
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            task_list = Task.objects.search(query, project=self.project)
+        else:
+            task_list = Task.objects.filter(project__id=self.project.id)
+        task_list = task_list\
                 .select_related('priority', 'status', 'author', 'project')
         filters = TaskFilter(self.request.GET, queryset=task_list,
             project=self.project)
-        if self.request.GET and 'id' in self.request.GET and \
-                self.request.GET['id'] and filters.qs.count() == 1:
-            task = filters.qs[0]
-            messages.info(self.request, _("One task matched - redirecting..."))
-            return redirect(task.get_absolute_url())
+        if self.request.GET.get('id'):
+            tasks = list(filters.qs[:2])
+            if len(tasks) == 1:
+                messages.info(self.request,
+                    _("One task matched - redirecting..."))
+                return redirect(tasks[0].get_absolute_url())
+
+        per_page = get_config_value('TASK_LIST_PAGINATE_BY')
+        sort = self.request.GET.get('sort')
+        if query and sort not in self.sort_fields:
+            page, param = self.get_ranked_page(filters.qs, per_page), 'page'
+        else:
+            field, nullable = self.sort_fields.get(sort, ('id', False))
+            if sort in self.sort_fields:
+                descending = self.request.GET.get('dir') == 'desc'
+            else:
+                descending = True
+            paginator = KeysetPaginator(filters.qs, field, per_page,
+                descending=descending, nullable=nullable)
+            page = paginator.page(
+                after=self.request.GET.get('after') or None,
+                before=self.request.GET.get('before') or None)
+            param = None
+
+        is_filtered = bool(query) or any(self.request.GET.get(name)
+            for name in filters.filters)
+        task_count, task_count_is_exact = self.get_task_count(filters.qs,
+            is_filtered)
+
         self.context['filters'] = filters
+        self.context['query'] = query
+        self.context['task_list'] = page.object_list
+        self.context['task_count'] = task_count
+        self.context['task_count_is_exact'] = task_count_is_exact
+        if page.has_next():
+            self.context['next_url'] = self.get_page_url(param or 'after',
+                page.next_cursor)
+        if page.has_previous():
+            self.context['previous_url'] = self.get_page_url(
+                param or 'before', page.previous_cursor)
         return self.context
 
+    def get_ranked_page(self, task_list, per_page):
+        """
+        Returns page of search results ordered by relevance. Relevance is not
+        stored at the database so those are paginated by offset.
+        """
+        try:
+            number = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            number = 1
+        start = (number - 1) * per_page
+        tasks = list(task_list[start:start + per_page + 1])
+        next_number = len(tasks) > per_page and number + 1 or None
+        previous_number = number > 1 and number - 1 or None
+        return KeysetPage(tasks[:per_page], next_number, previous_number)
+
+    def get_task_count(self, task_list, is_filtered):
+        """
+        Returns tuple of number of listed tasks and flag telling if it is
+        exact. Unfiltered list is counted by project's task counter, others
+        are counted up to :setting:`PROJECTOR_TASK_LIST_COUNT_LIMIT`.
+        """
+        if not is_filtered:
+            return self.project.task_count, True
+        limit = get_config_value('TASK_LIST_COUNT_LIMIT')
+        count = len(task_list.order_by().values_list('pk', flat=True)\
+            [:limit + 1])
+        return min(count, limit), count <= limit
+
+    def get_page_url(self, param, value):
+        data = self.request.GET.copy()
+        for key in ('after', 'before', 'page'):
+            data.pop(key, None)
+        data[param] = value
+        return '?' + data.urlencode()
+
 
 class TaskListDataView(ProjectView):
     """
@@ -83,7 +180,32 @@ class TaskDetailView(ProjectView):
         self.context['task'] = task
         self.context['is_watched'] = task.is_watched(request.user)
         self.context['now'] = datetime.datetime.now()
+        revisions, revisions_before = task.get_revision_window()
+        self.context['revisions'] = revisions
+        self.context['revisions_before'] = revisions_before
+
+        return self.context
 
+
+class TaskRevisionsView(ProjectView):
+    """
+    Returns next window of task's history (revisions older than the one
+    given by ``before`` GET parameter) as html fragment.
+    """
+
+    template_name = 'projector/project/task/revisions.html'
+    perms_private = ['view_project', 'can_view_tasks']
+
+    def response(self, request, username, project_slug, task_id):
+        task = get_object_or_404(Task, id=task_id, project=self.project)
+        try:
+            before = int(request.GET.get('before', ''))
+        except ValueError:
+            raise Http404
+        revisions, revisions_before = task.get_revision_window(before=before)
+        self.context['task'] = task
+        self.context['revisions'] = revisions
+        self.context['revisions_before'] = revisions_before
         return self.context
 
 class TaskCreateView(ProjectView):
@@ -115,7 +237,7 @@ class TaskCreateView(ProjectView):
                 )
                 task.create_revision()
                 messages.success(request, _("Task created succesfully."))
-                task.notify()
+                schedule_task_notification(task)
                 return redirect(task.get_absolute_url())
 
         self.context['form'] = form
@@ -148,7 +270,7 @@ class TaskEditView(ProjectView):
                 )
                 task.create_revision()
                 messages.success(request, _("Task updated successfully."))
-                task.notify()
+                schedule_task_notification(task)
                 return redirect(task.get_absolute_url())
         else:
             form = TaskEditForm(instance=task, initial={
@@ -10,7 +10,6 @@ from projector.models import Team
 from projector.views.project import ProjectView
 from projector.forms import TeamForm, ProjectTeamPermissionsForm, TeamDeleteForm
 
-from guardian.shortcuts import get_perms
 from guardian.models import GroupObjectPermission
 
 class TeamListView(ProjectView):
@@ -72,7 +71,7 @@ class TeamEditView(ProjectView):
             project__slug=project_slug, group__name=name)
 
         group, project = team.group, team.project
-        team_perms = get_perms(group, project)
+        team_perms = team.perms
 
         form = ProjectTeamPermissionsForm(request.POST or None,
             team = team,
@@ -39,7 +39,7 @@ def get_actual_status_img(request, output_format='png', width=600, height=600):
     pie.height = height / 2
 
     pie.labels = [ s.name for s in status_list ]
-    pie.data = [ s.task_set.count() for s in status_list ]
+    pie.data = [ s.task_count for s in status_list ]
     pie.slices[3].fontColor = colors.red
     pie.slices[0].fillColor = colors.darkcyan
     pie.slices[1].fillColor = colors.blueviolet